@@ -1,43 +1,47 @@
+from io import StringIO
+
 from django.contrib import admin
-from mistune import Markdown
+from django.core.management import call_command
 
-from .markdown import PostRenderer, PostInlineLexer
-from .models import Post, Page, SocialLink, HeaderImage, Category
+from .markdown import render_markdown
+from .models import Post, Page, SocialLink, HeaderImage, Category, make_excerpt
+from .search import index_posts
 
-# Add custom markdown renderer
-renderer = PostRenderer()
-inline = PostInlineLexer(renderer)
-inline.enable_woo()
-inline.enable_emdash()
-inline.enable_figure()
-inline.enable_gallery()
 
-markdown = Markdown(renderer, inline=inline, escape=False)
+def set_published(queryset, published):
+    """Saves posts one by one, so signals update tag index, fragments and cached pages"""
+    for post in queryset.exclude(published=published):
+        post.published = published
+        post.save(update_fields=['published'])
 
 
 def publish(modeladmin, request, queryset):
-    queryset.update(published=True)
+    set_published(queryset, True)
     publish.short_description = "Set to published"
 
 
 def unpublish(modeladmin, request, queryset):
-    queryset.update(published=False)
+    set_published(queryset, False)
     unpublish.short_description = "Set to unpublished"
 
 
 def refresh_markdown(modeladmin, request, queryset):
     refresh_markdown.short_description = "Refresh markdown"
 
-    for q in queryset:
-        PostAdmin.save_model(modeladmin, request, q, None, None)
+    output = StringIO()
+    # Forking a web worker, which may run threads processing images, could deadlock
+    call_command('refresh_markdown', *queryset.values_list('pk', flat=True), workers=1, stdout=output)
+    modeladmin.message_user(request, output.getvalue().splitlines()[-1])
 
 
 class PostAdmin(admin.ModelAdmin):
     actions = [publish, unpublish, refresh_markdown]
 
     def save_model(self, request, obj, form, change):
-        obj.content = markdown(obj.raw_content)
+        obj.content = render_markdown(obj.raw_content)
+        obj.excerpt = make_excerpt(obj.content)
         obj.save()
+        index_posts([obj])
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,196 @@
+import hashlib
+import time
+from calendar import timegm
+from functools import wraps
+from math import ceil
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def is_shared_cache():
+    """Whether the default cache is seen by every process of the site, which versions and purging rely on"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared_cache():
+        return []
+    return [checks.Warning(
+        'Default cache is local to each process, so changes made in one process are not seen by others.',
+        hint='Set CACHES to a shared backend, e.g. files or memcached, see config-example.py.',
+        id='blog.W001')]
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def version_key(name):
+    return 'blog:version:%s' % name
+
+
+def get_version(name):
+    """
+    Returns current version of given group of content (e.g. 'posts')
+
+    Version is a timestamp in milliseconds of the last change, so it never goes
+    back even if cache was cleared in the meantime. It's kept in the shared cache,
+    so every worker gives the same validators for conditional GET.
+    """
+    key = version_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = _now_ms()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def now_and_on_commit(function):
+    """
+    Calls function right away and once more after current transaction commits
+
+    Request served in between would see the database from before the transaction
+    and cache it again, e.g. under the version which was just bumped.
+    """
+    function()
+    transaction.on_commit(function)
+
+
+def _bump_version(name):
+    cache.set(version_key(name), max(_now_ms(), get_version(name) + 1), None)
+
+
+def bump_version(name):
+    """Marks group of content as changed, so everything keyed with its version becomes stale"""
+    now_and_on_commit(lambda: _bump_version(name))
+
+
+def increment(key, delta=1):
+    """
+    Adds delta to counter kept in the shared cache, creating it when it's missing
+
+    Counts are approximate, incr of file based cache reads and writes without a lock.
+    """
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Counter was never set, or it was culled
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+# Hits and misses of site chrome cache (pages, social links, tags) in this process
+chrome_stats = {'hits': 0, 'misses': 0}
+
+
+def chrome_key(name):
+    return 'blog:chrome:%s' % name
+
+
+def get_chrome(name, build):
+    """
+    Returns cached piece of site chrome shared by every rendered page
+
+    :param name: name of the piece, e.g. 'pages'
+    :param build: function returning the value when it's not cached, must not return None
+    """
+    value = cache.get(chrome_key(name))
+    if value is None:
+        chrome_stats['misses'] += 1
+        value = build()
+        cache.set(chrome_key(name), value, getattr(settings, 'BLOG_CHROME_CACHE_TIMEOUT', 300))
+    else:
+        chrome_stats['hits'] += 1
+    return value
+
+
+def invalidate_chrome(*names):
+    now_and_on_commit(lambda: cache.delete_many([chrome_key(name) for name in names]))
+
+
+def chrome_hit_rate():
+    total = chrome_stats['hits'] + chrome_stats['misses']
+    return chrome_stats['hits'] / total if total else 0.0
+
+
+def response_key(path):
+    """
+    Returns cache key of the response for given path
+
+    Key includes version of 'site' which covers things rendered on every page like navigation.
+    """
+    return 'blog:response:%s:%s' % (get_version('site'), hashlib.md5(path.encode('utf-8')).hexdigest())
+
+
+def cache_page_anonymous(view):
+    """
+    Caches whole responses of the view for anonymous readers, keyed on path
+
+    Logged in users see unpublished posts, so they always get fresh response.
+    Responses are purged by blog.purge whenever post, its tags or pages change.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        timeout = getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 600)
+        if (not timeout or request.method not in ('GET', 'HEAD') or request.GET
+                or request.user.is_authenticated):
+            return view(request, *args, **kwargs)
+
+        key = response_key(request.path)
+        response = cache.get(key)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, response, timeout)
+        return response
+    return wrapper
+
+
+def validators(request, posts):
+    """
+    Returns ETag and Last-Modified (as timestamp) of response showing given posts
+
+    Only the latest pub_date is queried, posts themselves are not loaded.
+    Edits without changing pub_date are covered by version of posts.
+    """
+    latest = posts.aggregate(latest=Max('pub_date'))['latest']
+    latest = timegm(latest.utctimetuple()) if latest is not None else 0
+    versions = [get_version('posts'), get_version('site')]
+    audience = 'user' if request.user.is_authenticated else 'anonymous'
+
+    etag = quote_etag('%s-%s-%s-%s' % (audience, latest, versions[0], versions[1]))
+    last_modified = max(latest, int(ceil(max(versions) / 1000)))
+    return etag, last_modified
+
+
+def conditional(get_posts):
+    """
+    Answers conditional GET requests with 304 Not Modified when posts shown by the view didn't change
+
+    :param get_posts: function taking the same arguments as the view and returning queryset of shown posts
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = validators(request, get_posts(request, *args, **kwargs))
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    response['ETag'] = etag
+                    response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -1,24 +1,31 @@
 from django.conf import settings
 
-from .models import Page, SocialLink, Post
+from .cache import get_chrome
+from .models import Page, SocialLink, TagCount
 
 # Remember to add new function to TEMPLATES in settings
+# Results are cached, remember to invalidate them in signals.py
+
+def cached_pages():
+    """Returns all pages, they are used for navigation and looked up by views.page"""
+    return get_chrome('pages', lambda: list(Page.objects.order_by('order')))
+
 
 def page_list(request):
     return {
-        "pages": Page.objects.order_by('order')
+        "pages": cached_pages()
     }
 
 
 def tags_list(request):
     return {
-        "tags": Post.tags.most_common()[:5]
+        "tags": get_chrome('tags', lambda: TagCount.most_common(5))
     }
 
 
 def social_links(request):
     return {
-        "social_links": SocialLink.objects.order_by('order')
+        "social_links": get_chrome('social_links', lambda: list(SocialLink.objects.order_by('order')))
     }
 
 
@@ -1,24 +1,229 @@
-from django.contrib.syndication.views import Feed
+import copy
+import datetime
+from calendar import timegm
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sites.shortcuts import get_current_site
+from django.contrib.syndication.views import Feed, add_domain
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Max, QuerySet
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.template import TemplateDoesNotExist, loader
 from django.urls import reverse
+from django.utils.http import http_date
+from django.utils.timezone import get_default_timezone, is_naive, make_aware, utc
+from django.utils.xmlutils import SimplerXMLGenerator
 from taggit.models import Tag
 
-from .models import Post
+from .cache import conditional
+from .models import Post, TaggedPost
+from .slugs import require
+
+
+# Items read from the database at once by streaming feeds
+FEED_CHUNK_SIZE = 20
+
+
+def published_posts(request):
+    return Post.objects.filter(published=True)
+
+
+def tagged_posts(request, tag_slug):
+    return TaggedPost.objects.filter(published=True, tag__slug=tag_slug)
+
+
+class ConditionalFeed(Feed):
+    """Feed answering conditional GET requests from RSS readers with 304 Not Modified"""
+
+    def __init__(self, get_posts):
+        """
+        :param get_posts: function taking the same arguments as the feed view and returning queryset
+                          of posts which can be in the feed
+        """
+        self.get_posts = get_posts
+
+    def __call__(self, request, *args, **kwargs):
+        view = self.stream if getattr(settings, 'BLOG_FEED_STREAMING', False) else super().__call__
+        return conditional(self.get_posts)(view)(request, *args, **kwargs)
+
+    def stream(self, request, *args, **kwargs):
+        """
+        Same as Feed.__call__, but items are written one by one as they are read from the database
+
+        Output is the same byte by byte, only RSS feed types are supported.
+        """
+        try:
+            obj = self.get_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Feed object does not exist.')
+
+        # Feed without items has the same channel elements, except lastBuildDate taken from items
+        header = copy.copy(self)
+        header.items = lambda: []
+        feed = Feed.get_feed(header, obj, request)
+
+        items = self._get_dynamic_attr('items', obj)
+        latest = items.aggregate(latest=Max('pub_date'))['latest']
+        feed.latest_post_date = lambda: latest or datetime.datetime.utcnow().replace(tzinfo=utc)
+
+        response = StreamingHttpResponse(self.write_feed(feed, obj, items, request), content_type=feed.content_type)
+        response['Last-Modified'] = http_date(timegm(feed.latest_post_date().utctimetuple()))
+        return response
+
+    def write_feed(self, feed, obj, items, request):
+        """Yields encoded parts of the feed, like RssFeed.write writes them"""
+        output = StringIO()
+        handler = SimplerXMLGenerator(output, 'utf-8')
+
+        def flush():
+            part = output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+            return part
+
+        handler.startDocument()
+        handler.startElement('rss', feed.rss_attributes())
+        handler.startElement('channel', feed.root_attributes())
+        feed.add_root_elements(handler)
+        yield flush()
+
+        for item in self.feed_items(feed, obj, items, request):
+            handler.startElement('item', feed.item_attributes(item))
+            feed.add_item_elements(handler, item)
+            handler.endElement('item')
+            yield flush()
+
+        feed.endChannelElement(handler)
+        handler.endElement('rss')
+        yield flush()
+
+    def read_items(self, items):
+        """
+        Yields posts read in chunks, so only ids of all of them are kept in memory
+
+        iterator() wouldn't do, SQLite and MySQL backends fetch the whole result at once.
+        """
+        if not isinstance(items, QuerySet):
+            yield from items
+            return
+
+        pks = list(items.values_list('pk', flat=True))
+        # Chunks are loaded with the filter of the feed, so posts unpublished in the meantime are skipped
+        posts = items.all()
+        posts.query.clear_limits()
+        posts.query.clear_ordering(force_empty=True)
+        for start in range(0, len(pks), FEED_CHUNK_SIZE):
+            chunk = pks[start:start + FEED_CHUNK_SIZE]
+            loaded = posts.in_bulk(chunk)
+            for pk in chunk:
+                # Post could be deleted or unpublished in the meantime
+                if pk in loaded:
+                    yield loaded[pk]
 
+    def feed_items(self, feed, obj, items, request):
+        """Yields items as Feed.get_feed adds them to the feed, without keeping them"""
+        current_site = get_current_site(request)
 
-class LatestPostsFeed(Feed):
+        title_tmp = None
+        if self.title_template is not None:
+            try:
+                title_tmp = loader.get_template(self.title_template)
+            except TemplateDoesNotExist:
+                pass
+
+        description_tmp = None
+        if self.description_template is not None:
+            try:
+                description_tmp = loader.get_template(self.description_template)
+            except TemplateDoesNotExist:
+                pass
+
+        for item in self.read_items(items):
+            context = self.get_context_data(item=item, site=current_site, obj=obj, request=request)
+            if title_tmp is not None:
+                title = title_tmp.render(context, request)
+            else:
+                title = self._get_dynamic_attr('item_title', item)
+            if description_tmp is not None:
+                description = description_tmp.render(context, request)
+            else:
+                description = self._get_dynamic_attr('item_description', item)
+            link = add_domain(current_site.domain, self._get_dynamic_attr('item_link', item), request.is_secure())
+            enclosures = self._get_dynamic_attr('item_enclosures', item)
+            author_name = self._get_dynamic_attr('item_author_name', item)
+            if author_name is not None:
+                author_email = self._get_dynamic_attr('item_author_email', item)
+                author_link = self._get_dynamic_attr('item_author_link', item)
+            else:
+                author_email = author_link = None
+
+            tz = get_default_timezone()
+
+            pubdate = self._get_dynamic_attr('item_pubdate', item)
+            if pubdate and is_naive(pubdate):
+                pubdate = make_aware(pubdate, tz)
+
+            updateddate = self._get_dynamic_attr('item_updateddate', item)
+            if updateddate and is_naive(updateddate):
+                updateddate = make_aware(updateddate, tz)
+
+            feed.add_item(
+                title=title,
+                link=link,
+                description=description,
+                unique_id=self._get_dynamic_attr('item_guid', item, link),
+                unique_id_is_permalink=self._get_dynamic_attr('item_guid_is_permalink', item),
+                enclosures=enclosures,
+                pubdate=pubdate,
+                updateddate=updateddate,
+                author_name=author_name,
+                author_email=author_email,
+                author_link=author_link,
+                categories=self._get_dynamic_attr('item_categories', item),
+                item_copyright=self._get_dynamic_attr('item_copyright', item),
+                **self.item_extra_kwargs(item)
+            )
+            yield feed.items.pop()
+
+    def summary_only(self):
+        return getattr(settings, 'BLOG_FEED_SUMMARY', False)
+
+    def deferred(self, posts):
+        """Skips columns which are not used in the feed"""
+        if self.summary_only():
+            return posts.defer('raw_content', 'content')
+        return posts.defer('raw_content', 'excerpt')
+
+    def bounded(self, posts):
+        """Limits number of items and skips columns which are not used in the feed"""
+        posts = self.deferred(posts)
+        limit = getattr(settings, 'BLOG_FEED_ITEMS', 20)
+        if limit:
+            posts = posts[:limit]
+        return posts
+
+    def item_description(self, item):
+        if self.summary_only():
+            return item.excerpt
+        return item.content
+
+
+class LatestPostsFeed(ConditionalFeed):
     title = "PR0GRAMISTA"
     link = "/rss/"
     description = "Ostatnie posty na blogu PR0GRAMISTA.pl"
 
+    def __init__(self):
+        super().__init__(published_posts)
+
     def items(self):
-        return Post.objects.filter(published=True).order_by('-pub_date').all()
+        return self.bounded(Post.objects.filter(published=True).order_by('-pub_date'))
 
     def item_title(self, item):
         return item.title
 
-    def item_description(self, item):
-        return item.content
-
     def item_pubdate(self, item):
         return item.pub_date
 
@@ -26,12 +231,21 @@ class LatestPostsFeed(Feed):
         return reverse('post', args=[item.slug])
 
 
-class TagPostsFeed(Feed):
+class TagPostsFeed(ConditionalFeed):
+    def __init__(self):
+        super().__init__(tagged_posts)
+
+    def __call__(self, request, tag_slug):
+        require('tag', tag_slug)
+        return super().__call__(request, tag_slug=tag_slug)
+
     def get_object(self, request, tag_slug):
-        return Tag.objects.get(slug=tag_slug)
+        return get_object_or_404(Tag, slug=tag_slug)
 
     def items(self, obj):
-        return Post.objects.filter(published=True).filter(tags__slug__in=[obj.slug]).order_by('-pub_date').all()
+        # Ordered by the tag index, so posts are read with a single range scan
+        return self.bounded(Post.objects.filter(tag_index__tag=obj, tag_index__published=True)
+                            .order_by('-tag_index__pub_date'))
 
     def link(self, obj):
         return "/tag/%s/rss" % obj.slug
@@ -42,9 +256,6 @@ class TagPostsFeed(Feed):
     def item_title(self, item):
         return item.title
 
-    def item_description(self, item):
-        return item.content
-
     def item_pubdate(self, item):
         return item.pub_date
 
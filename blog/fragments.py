@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db.models import Case, TextField, Value, When
+from django.template.loader import render_to_string
+from django.utils import translation
+
+from .models import Post
+
+
+def render_fragments(post):
+    """
+    Returns tuple of preview (index) and widget (tag listing) HTML of the post
+
+    Listings only concatenate these, so they have to be rendered again whenever
+    anything shown in them changes: title, image, category, tags or publishing.
+    """
+    # Management commands deactivate translations, dates would be in English otherwise
+    with translation.override(settings.LANGUAGE_CODE):
+        context = {'post': post}
+        return render_to_string('blog/preview.html', context), render_to_string('blog/widget.html', context)
+
+
+def refresh_fragments(posts):
+    """Renders fragments of given posts and saves them with a single UPDATE query"""
+    posts = list(posts)
+    if not posts:
+        return
+
+    for post in posts:
+        post.preview_html, post.widget_html = render_fragments(post)
+    Post.objects.filter(pk__in=[post.pk for post in posts]).update(
+        preview_html=Case(*[When(pk=post.pk, then=Value(post.preview_html)) for post in posts],
+                          output_field=TextField()),
+        widget_html=Case(*[When(pk=post.pk, then=Value(post.widget_html)) for post in posts],
+                         output_field=TextField()))
@@ -1,4 +1,19 @@
-from pilkit.processors import ResizeToFit, Anchor
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models.fields.files import ImageFieldFile
+from django.db.models.signals import post_save
+from django.templatetags.static import static
+from imagekit import hashers
+from imagekit.models import ProcessedImageField
+from imagekit.models.fields.files import ProcessedImageFieldFile
+from imagekit.specs import ImageSpec
+from pilkit.lib import Image
+from pilkit.processors import ProcessorPipeline, ResizeToFit, Anchor
+from pilkit.utils import open_image, prepare_image, save_image
+
+from . import images
 
 
 class UpscaleToFit(object):
@@ -21,3 +36,189 @@ class UpscaleToFit(object):
             return self.processor.process(img)
         else:
             return img
+
+
+class FillHeader(object):
+    """
+    Same as ResizeToFill(width, height, upscale=False), UpscaleToFit(min_width, min_height)
+    and ResizeCanvas(width, height, color) in a row, but with a single resample
+
+    The chain converts whole uploaded image to RGBA before resizing and allocates
+    a new canvas in every step. Here geometry of all steps is computed first,
+    RGB images are converted only after they are cropped and the final canvas
+    is skipped when the image covers it anyway. Output is the same pixel by pixel.
+    """
+
+    def __init__(self, width, height, min_width, min_height, color=None):
+        self.width = width
+        self.height = height
+        self.min_width = min_width
+        self.min_height = min_height
+        self.color = color or (255, 255, 255, 0)
+
+    def process(self, img):
+        # ResizeToCover, which only shrinks images larger in both dimensions
+        width, height = img.size
+        ratio = max(float(self.width) / width, float(self.height) / height)
+        cover = int(round(width * ratio)), int(round(height * ratio))
+        if cover[0] < width and cover[1] < height:
+            # Resampling is done per channel, so RGB gives the same pixels as RGBA with opaque alpha
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA')
+            img = img.resize(cover, Image.ANTIALIAS)
+            width, height = cover
+
+        # Crop to the center, pasting on a transparent canvas converts it to RGBA
+        crop = min(width, self.width), min(height, self.height)
+        left, top = -int((crop[0] - width) * 0.5), -int((crop[1] - height) * 0.5)
+        if crop != (width, height):
+            img = img.crop((left, top, left + crop[0], top + crop[1]))
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        width, height = crop
+
+        # UpscaleToFit
+        if width < self.min_width and height < self.min_height:
+            ratio = min(float(self.min_width) / width, float(self.min_height) / height)
+            img = img.resize((int(round(width * ratio)), int(round(height * ratio))), Image.ANTIALIAS)
+            width, height = img.size
+
+        if (width, height) == (self.width, self.height):
+            return img
+        canvas = Image.new('RGBA', (self.width, self.height), self.color)
+        canvas.paste(img, (int((self.width - width) * 0.5), int((self.height - height) * 0.5)))
+        return canvas
+
+
+# Quality is never lowered below that to fit in byte budget
+MIN_QUALITY = 40
+
+
+def save(img, format, options):
+    return save_image(img, BytesIO(), format, options, autoconvert=False)
+
+
+def size(content):
+    return len(content.getvalue())
+
+
+def optimize(img, format, options, budget=None):
+    """
+    Returns file with image saved as small as possible
+
+    Metadata like EXIF and ICC profiles is dropped, JPEGs are progressive and
+    their quality is lowered (down to MIN_QUALITY) until they fit in budget of
+    bytes. PNGs are quantized to 256 colors when it makes them smaller.
+    """
+    img, save_kwargs = prepare_image(img, format)
+    img.info = {}
+    save_kwargs.update(options)
+    options = save_kwargs
+
+    if format == 'JPEG':
+        options.update(optimize=True, progressive=True)
+        content = save(img, format, options)
+        if budget is None or size(content) <= budget:
+            return content
+        return fit_budget(img, options, budget) or save(img, format, dict(options, quality=MIN_QUALITY))
+
+    if format == 'PNG':
+        options['optimize'] = True
+        candidates = [save(img, format, options)]
+        if img.mode in ('RGB', 'RGBA'):
+            quantized = img.quantize(256, method=2 if img.mode == 'RGBA' else 0)
+            candidates.append(save(quantized, format, options))
+        return min(candidates, key=size)
+
+    return save(img, format, options)
+
+
+def fit_budget(img, options, budget):
+    """Returns JPEG with the highest quality which fits in budget, None if none does"""
+    best = None
+    low, high = MIN_QUALITY, options.get('quality', 75) - 1
+    while low <= high:
+        quality = (low + high) // 2
+        content = save(img, 'JPEG', dict(options, quality=quality))
+        if size(content) <= budget:
+            best, low = content, quality + 1
+        else:
+            high = quality - 1
+    return best
+
+
+class OptimizedImageSpec(ImageSpec):
+    """ImageSpec saving images with optimize() instead of plain Image.save()"""
+
+    budget = None
+
+    def get_hash(self):
+        return hashers.pickle([super().get_hash(), 'optimized', self.budget])
+
+    def generate(self):
+        if not self.source:
+            raise self.MissingSource("The spec '%s' has no source file associated with it." % self)
+
+        closed = self.source.closed
+        if closed:
+            self.source.open()
+        try:
+            img = open_image(self.source)
+            original_format = img.format
+            img = ProcessorPipeline(self.processors or []).process(img)
+        finally:
+            if closed:
+                self.source.close()
+        return optimize(img, self.format or original_format or 'JPEG', dict(self.options or {}), self.budget)
+
+
+def optimized_spec(processors=None, format=None, options=None, budget=None):
+    """Returns spec class for the spec argument of imagekit fields"""
+    return type('OptimizedSpec', (OptimizedImageSpec,), {
+        'processors': processors or [], 'format': format, 'options': options, 'budget': budget})
+
+
+class BackgroundProcessedImageFieldFile(ProcessedImageFieldFile):
+    """Stores uploaded image as it is, processors are run later by blog.images"""
+
+    def save(self, name, content, save=True):
+        ImageFieldFile.save(self, posixpath.join(images.PENDING_DIR, name), content, save)
+
+    @property
+    def ready(self):
+        return bool(self.name) and not images.is_pending(self.name)
+
+    @property
+    def url(self):
+        if self.name and not self.ready:
+            return static(getattr(settings, 'BLOG_IMAGE_PLACEHOLDER', 'placeholder.svg'))
+        return super().url
+
+
+class BackgroundProcessedImageField(ProcessedImageField):
+    """
+    ProcessedImageField which doesn't block upload request with processing
+
+    Original is kept in pending directory and placeholder is shown until
+    processed image replaces it.
+    """
+    attr_class = BackgroundProcessedImageFieldFile
+
+    def __init__(self, processors=None, format=None, options=None, budget=None, **kwargs):
+        """
+        Takes the same arguments as ProcessedImageField
+
+        :param budget: maximum size of JPEG in bytes, quality is lowered to fit in it
+        """
+        super().__init__(spec=optimized_spec(processors, format, options, budget), **kwargs)
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        post_save.connect(self.schedule, sender=cls, weak=False)
+
+    def schedule(self, sender, instance, raw=False, **kwargs):
+        image = getattr(instance, self.attname)
+        if not raw and image.name and not image.ready:
+            name = images.schedule(sender, instance.pk, self.attname)
+            if name is not None:
+                setattr(instance, self.attname, name)
@@ -0,0 +1,111 @@
+import logging
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from imagekit.utils import generate, suggest_extension
+
+from .cache import increment
+
+logger = logging.getLogger(__name__)
+
+# Uploaded images wait for processing in this directory inside upload_to
+PENDING_DIR = 'pending'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_pending(name):
+    return ('/%s/' % PENDING_DIR) in ('/' + name)
+
+
+def processed_name(name, spec):
+    """Returns name of processed image, which is the original one outside of pending directory"""
+    directory, filename = ('/' + name).rsplit('/%s/' % PENDING_DIR, 1)
+    filename = posixpath.splitext(filename)[0] + suggest_extension(filename, spec.format)
+    return posixpath.join(directory.lstrip('/'), filename)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'BLOG_IMAGE_WORKERS', 2))
+        return _executor
+
+
+def schedule(model, pk, field_name):
+    """
+    Processes uploaded image in background thread after current transaction commits
+
+    With BLOG_IMAGE_WORKERS set to 0 image is processed right away and its new name is returned.
+    """
+    if not getattr(settings, 'BLOG_IMAGE_WORKERS', 2):
+        return process(model, pk, field_name)
+
+    increment('blog:images:queued')
+    transaction.on_commit(lambda: get_executor().submit(process_in_thread, model, pk, field_name))
+
+
+def process_in_thread(model, pk, field_name):
+    try:
+        process(model, pk, field_name)
+    except Exception:
+        logger.exception('Processing %s of %s %s failed', field_name, model.__name__, pk)
+        increment('blog:images:failed')
+    finally:
+        increment('blog:images:queued', -1)
+        # Threads of the pool would keep their connections open forever otherwise
+        connection.close()
+
+
+def process(model, pk, field_name):
+    """Runs processors of the field on pending image, replaces it with the result and returns its name"""
+    start = time.time()
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    image = getattr(instance, field_name)
+    original = image.name
+    if not original or not is_pending(original):
+        return
+
+    spec = image.field.get_spec(source=image.file)
+    name = image.storage.save(processed_name(original, spec), generate(spec))
+    image.close()
+
+    with transaction.atomic():
+        current = model._default_manager.select_for_update().filter(pk=pk).first()
+        if current is None or getattr(current, field_name).name != original:
+            # Image was replaced or deleted in the meantime
+            image.storage.delete(name)
+            return
+        setattr(current, field_name, name)
+        current.save(update_fields=[field_name])
+    image.storage.delete(original)
+
+    increment('blog:images:processed')
+    increment('blog:images:milliseconds', int((time.time() - start) * 1000))
+    return name
+
+
+def stats():
+    """
+    Returns numbers of queued, processed and failed images and average processing time in seconds
+
+    Counters are kept in the shared cache, so they include images processed by all web workers.
+    """
+    values = cache.get_many(['blog:images:queued', 'blog:images:processed',
+                             'blog:images:failed', 'blog:images:milliseconds'])
+    processed = values.get('blog:images:processed', 0)
+    return {
+        'queued': max(0, values.get('blog:images:queued', 0)),
+        'processed': processed,
+        'failed': values.get('blog:images:failed', 0),
+        'average': values.get('blog:images:milliseconds', 0) / 1000 / processed if processed else 0.0,
+    }
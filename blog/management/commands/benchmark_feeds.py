@@ -0,0 +1,75 @@
+import hashlib
+import multiprocessing
+import resource
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import Post, HeaderImage
+
+SIZES = [100, 200, 400, 800]
+
+# Posts are long, so memory taken by the feed stands out
+PARAGRAPH = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. ' * 10
+PARAGRAPHS = 40
+
+
+def seed(posts):
+    image = HeaderImage.objects.create(image='images/posts/benchmark.jpg')
+    now = timezone.now()
+    content = '\n'.join('<p>%d %s</p>' % (n, PARAGRAPH) for n in range(PARAGRAPHS))
+    Post.objects.bulk_create([Post(
+        title='Post %d' % n, slug='post-%d' % n, image=image, pub_date=now - timezone.timedelta(hours=n),
+        raw_content=content, content=content, published=True) for n in range(posts)], batch_size=100)
+
+
+def fetch(args):
+    """Runs in a fresh process, returns digest and size of the feed and peak memory added by the request"""
+    items, streaming = args
+    with override_settings(BLOG_FEED_ITEMS=items, BLOG_FEED_STREAMING=streaming):
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        response = Client().get(reverse('rss_index'))
+        digest = hashlib.md5()
+        size = 0
+        # Parts are dropped once they are written, like a server sending them to the client does
+        for part in response:
+            digest.update(part)
+            size += len(part)
+        return digest.hexdigest(), size, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+
+class Command(BaseCommand):
+    help = 'Compares peak memory of buffered and streaming RSS feeds as number of items grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Numbers of items in the feed')
+
+    def handle(self, *args, **options):
+        isolated = override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'],
+                                     BLOG_PROFILING=False)
+        isolated.enable()
+        # Posts are created in a fresh test database, which forked processes inherit
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            seed(max(options['sizes']))
+
+            # Every measurement gets its own process, so peak memory of one doesn't hide the other
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+            try:
+                self.stdout.write('%8s %12s %14s %15s' % ('items', 'feed size', 'buffered peak', 'streaming peak'))
+                for items in sorted(options['sizes']):
+                    buffered = pool.apply(fetch, [(items, False)])
+                    streamed = pool.apply(fetch, [(items, True)])
+                    if buffered[:2] != streamed[:2]:
+                        raise CommandError('Streaming feed with %d items differs from buffered one' % items)
+                    self.stdout.write('%8d %9d KiB %10d KiB %11d KiB' % (
+                        items, buffered[1] // 1024, buffered[2], streamed[2]))
+            finally:
+                pool.terminate()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            isolated.disable()
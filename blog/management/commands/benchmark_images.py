@@ -0,0 +1,64 @@
+import multiprocessing
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+from pilkit.processors import ResizeToFill, ResizeCanvas
+
+from blog.imagekit import UpscaleToFit, FillHeader
+
+# Processors used by HeaderImage before they were fused
+CHAIN = [ResizeToFill(1024, 576, upscale=False), UpscaleToFit(512, 288), ResizeCanvas(1024, 576, color=(255, 255, 255))]
+FUSED = [FillHeader(1024, 576, 512, 288, color=(255, 255, 255))]
+
+SIZES = [(6000, 4000), (4000, 6000), (3000, 2000), (1024, 576), (400, 300)]
+
+
+def make_image(size):
+    return Image.effect_noise(size, 60).convert('RGB')
+
+
+def process(processors, img):
+    for processor in processors:
+        img = processor.process(img)
+    return img
+
+
+def measure(args):
+    """Runs in a fresh process, returns best time and peak memory added by processing"""
+    processors, size, repeat = args
+    img = make_image(size)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process(processors, img)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+
+class Command(BaseCommand):
+    help = 'Compares time and peak memory of the fused header processor with the original chain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Best of that many runs is taken')
+
+    def handle(self, *args, **options):
+        for size in SIZES:
+            img = make_image(size)
+            if process(CHAIN, img).tobytes() != process(FUSED, img).tobytes():
+                raise CommandError('Fused processor gives different image for %dx%d' % size)
+
+        # Every measurement gets its own process, so peak memory of one doesn't hide the other
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            self.stdout.write('%-11s %12s %12s %12s %12s' % ('size', 'chain', 'fused', 'chain peak', 'fused peak'))
+            for size in SIZES:
+                chain = pool.apply(measure, [(CHAIN, size, options['repeat'])])
+                fused = pool.apply(measure, [(FUSED, size, options['repeat'])])
+                self.stdout.write('%-11s %10.1f ms %10.1f ms %9d KiB %9d KiB' % (
+                    '%dx%d' % size, chain[0] * 1000, fused[0] * 1000, chain[1], fused[1]))
+        finally:
+            pool.terminate()
@@ -0,0 +1,52 @@
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.markdown import get_markdown
+
+# Inputs which made greedy (.*) rules of custom tags backtrack heavily
+ADVERSARIAL_INPUTS = {
+    'woo without link': lambda n: '!F[' + '][' * n + '\n',
+    'woo with brackets': lambda n: '!F[' + '[a]' * n + '][b][c][d](' + '(x)' * n + '\n',
+    'figure without link': lambda n: '![' + '][' * n + '\n',
+    'unclosed gallery': lambda n: 'Gallery[' + 'http://a.pl/b.png,' * n + '\n',
+    'many galleries': lambda n: 'Gallery[http://a.pl/b.png] ' * n + '\n',
+}
+
+
+class Command(BaseCommand):
+    help = 'Measures how render time of custom markdown tags grows with adversarial inputs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=200, help='Size of the smallest input')
+        parser.add_argument('--steps', type=int, default=4, help='Number of times the size is doubled')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of that many runs is taken')
+        parser.add_argument('--max-exponent', type=float, default=1.5,
+                            help='Fail if time grows faster than size to that power')
+
+    def handle(self, *args, **options):
+        markdown = get_markdown()
+        sizes = [options['size'] * 2 ** step for step in range(options['steps'])]
+        failed = []
+
+        for name, make_input in sorted(ADVERSARIAL_INPUTS.items()):
+            times = []
+            for size in sizes:
+                text = make_input(size)
+                best = None
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    markdown(text)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                times.append(best)
+
+            exponent = math.log(times[-1] / times[0]) / math.log(sizes[-1] / sizes[0])
+            self.stdout.write('%-20s %s  exponent %.2f' % (
+                name, '  '.join('%6d: %.4f s' % pair for pair in zip(sizes, times)), exponent))
+            if exponent > options['max_exponent']:
+                failed.append(name)
+
+        if failed:
+            raise CommandError('Render time grows super-linearly for: %s' % ', '.join(failed))
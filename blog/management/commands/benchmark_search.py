@@ -0,0 +1,114 @@
+import bisect
+import random
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from blog import views
+from blog.models import Post, HeaderImage
+from blog.search import available_backends, backend, index_posts, search_posts
+from blog.utils import percentile
+
+# Words in synthetic posts, frequencies follow Zipf's law like in real texts
+VOCABULARY_SIZE = 20000
+WORDS_PER_POST = 300
+BATCH_SIZE = 1000
+
+
+def choices(rng, population, cum_weights, k):
+    """Same as Random.choices, which isn't there before Python 3.6"""
+    return [population[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])] for _ in range(k)]
+
+
+def make_vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def seed(posts, vocabulary, rng, backends):
+    """Creates given number of published posts and indexes them with every backend"""
+    weights = list(accumulate(1.0 / rank for rank in range(1, len(vocabulary) + 1)))
+    image = HeaderImage.objects.create(image='images/posts/benchmark.jpg')
+    now = timezone.now()
+    for start in range(0, posts, BATCH_SIZE):
+        batch = Post.objects.bulk_create([Post(
+            title=' '.join(choices(rng, vocabulary, weights, 6)),
+            slug='benchmark-%d' % n,
+            image=image,
+            pub_date=now - timezone.timedelta(minutes=n),
+            raw_content=' '.join(choices(rng, vocabulary, weights, WORDS_PER_POST)),
+            published=True) for n in range(start, min(start + BATCH_SIZE, posts))])
+        # SQLite doesn't return ids of bulk created rows
+        batch = list(Post.objects.filter(slug__in=[post.slug for post in batch]).only('title', 'raw_content'))
+        for name in backends:
+            with override_settings(BLOG_SEARCH_BACKEND=name):
+                index_posts(batch)
+
+
+def make_queries(vocabulary, rng, number):
+    """Returns queries of one and two words, both frequent and rare ones"""
+    queries = []
+    for n in range(number):
+        words = [vocabulary[int(len(vocabulary) ** rng.random()) - 1] for _ in range(1 + n % 2)]
+        queries.append(' '.join(words))
+    return queries
+
+
+def run_query(query):
+    """Loads the first page of results like the search view does, returns number of results"""
+    page = Paginator(search_posts(views.listing(Post.objects.filter(published=True)), query), views.POSTS_PER_PAGE).page(1)
+    list(page)
+    return page.paginator.count
+
+
+class Command(BaseCommand):
+    help = 'Measures latency of search over synthetic corpus of posts in a test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=50000, help='Number of posts in the corpus')
+        parser.add_argument('--queries', type=int, default=200, help='Number of measured queries')
+        parser.add_argument('--backend', action='append', dest='backends',
+                            help='Backend to measure, may be repeated, the default one by default')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random corpus')
+
+    def handle(self, *args, **options):
+        # Corpus is created in a fresh test database, real posts are not touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            backends = options['backends'] or [backend()]
+            for name in backends:
+                if name not in available_backends():
+                    raise CommandError('%s backend is not available on this database' % name)
+
+            rng = random.Random(options['seed'])
+            vocabulary = make_vocabulary(rng)
+            start = time.time()
+            seed(options['posts'], vocabulary, rng, backends)
+            self.stdout.write('Seeded and indexed %d posts in %.2f s' % (options['posts'], time.time() - start))
+
+            queries = make_queries(vocabulary, rng, options['queries'])
+            self.stdout.write('%-8s %10s %10s %10s %10s' % ('backend', 'p50', 'p95', 'max', 'results'))
+            for name in backends:
+                with override_settings(BLOG_SEARCH_BACKEND=name):
+                    run_query(queries[0])
+                    times = []
+                    results = 0
+                    for query in queries:
+                        start = time.perf_counter()
+                        results += run_query(query)
+                        times.append(time.perf_counter() - start)
+                self.stdout.write('%-8s %7.1f ms %7.1f ms %7.1f ms %10.1f' % (
+                    name, percentile(times, 50) * 1000, percentile(times, 95) * 1000, max(times) * 1000,
+                    results / len(queries)))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,214 @@
+import json
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from blog.fragments import refresh_fragments
+from blog.markdown import render_markdown
+from blog.models import Post, Page, HeaderImage, make_excerpt
+from blog.utils import percentile, write_atomic
+
+ENDPOINTS = ['index', 'post', 'tag_pagination', 'page', 'rss_index', 'rss_tag']
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+         'et dolore magna aliqua python django cache query index template').split()
+
+# Only the first pages of listings are requested, like readers do
+MAX_LISTING_PAGE = 10
+
+
+def make_image(rng):
+    content = BytesIO()
+    Image.effect_noise((1600, 900), rng.randint(20, 80)).convert('RGB').save(content, 'JPEG')
+    return content.getvalue()
+
+
+def make_content(rng, paragraphs):
+    return '\n\n'.join(' '.join(rng.choice(WORDS) for _ in range(80)).capitalize() + '.' for _ in range(paragraphs))
+
+
+def add_post(title, published, content, image, pub_date, tags):
+    """Same as add_post of blog tests, but with shared header image and rendered content"""
+    post = Post.objects.create(
+        title=title,
+        slug=title.lower().replace(' ', '-'),
+        title_size=42,
+        title_background='rgba(0, 0, 0, 0.5)',
+        image=image,
+        pub_date=pub_date,
+        published=published,
+        fullwidth=True,
+        raw_content=content,
+        content=render_markdown(content),
+        excerpt=make_excerpt(render_markdown(content)))
+    post.tags.add(*tags)
+    return post
+
+
+def seed(options, rng):
+    """Creates corpus of given size, like an author would through admin"""
+    images = [HeaderImage.objects.create(image=SimpleUploadedFile('header-%d.jpg' % n, make_image(rng)))
+              for n in range(options['images'])]
+    tags = ['tag-%d' % n for n in range(options['tags'])]
+    now = timezone.now()
+    posts = []
+    for n in range(options['posts']):
+        # Every tenth post is a draft, popular tags are on more posts
+        posts.append(add_post(
+            'Post %d' % n, n % 10 != 9, make_content(rng, rng.randint(3, 12)), rng.choice(images),
+            now - timezone.timedelta(hours=n), set(rng.choice(tags[:rng.randint(1, len(tags))]) for _ in range(3))))
+    for start in range(0, len(posts), 100):
+        batch = Post.objects.filter(pk__in=[post.pk for post in posts[start:start + 100]])
+        refresh_fragments(list(batch.select_related('image', 'category').prefetch_related('tags')))
+    for n in range(options['pages']):
+        Page.objects.create(title='Page %d' % n, slug='page-%d' % n, content=make_content(rng, 3), order=n)
+
+
+def make_paths(rng):
+    """Returns functions giving random path of every endpoint"""
+    posts = list(Post.objects.filter(published=True).values_list('slug', flat=True))
+    tags = list(Post.tags.most_common().values_list('slug', flat=True))
+    pages = list(Page.objects.values_list('slug', flat=True))
+    listing_pages = min(MAX_LISTING_PAGE, max(1, len(posts) // 5))
+    return {
+        'index': lambda: reverse('index_pagination', args=[rng.randint(1, listing_pages)]),
+        'post': lambda: reverse('post', args=[rng.choice(posts)]),
+        'tag_pagination': lambda: reverse('tag_pagination', args=[rng.choice(tags), 1]),
+        'page': lambda: reverse('page', args=[rng.choice(pages)]),
+        'rss_index': lambda: reverse('rss_index'),
+        'rss_tag': lambda: reverse('rss_tag', args=[rng.choice(tags)]),
+    }
+
+
+def measure(client, paths):
+    """Returns times in seconds and numbers of queries of requests to given paths"""
+    times = []
+    queries = []
+    counter = [0]
+
+    def count(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        for path in paths:
+            counter[0] = 0
+            start = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            times.append(time.perf_counter() - start)
+            queries.append(counter[0])
+            if response.status_code != 200:
+                raise CommandError('%s returned %d' % (path, response.status_code))
+    return times, queries
+
+
+def summary(times, queries):
+    return {
+        'requests': len(times),
+        'rps': len(times) / sum(times),
+        'p50': percentile(times, 50) * 1000,
+        'p95': percentile(times, 95) * 1000,
+        'p99': percentile(times, 99) * 1000,
+        'queries': sum(queries) / len(queries),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Measures throughput and latency of public views over synthetic corpus in a test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=500, help='Number of posts in the corpus')
+        parser.add_argument('--tags', type=int, default=30, help='Number of tags in the corpus')
+        parser.add_argument('--images', type=int, default=5, help='Number of header images shared by posts')
+        parser.add_argument('--pages', type=int, default=5, help='Number of pages in the corpus')
+        parser.add_argument('--requests', type=int, default=200, help='Number of measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=20, help='Number of requests per endpoint before measuring')
+        parser.add_argument('--no-page-cache', action='store_true', help='Measure views without cached responses')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random corpus and requests')
+        parser.add_argument('--output', help='Save results to JSON file')
+        parser.add_argument('--compare', help='Show change against results saved with --output before')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        media_root = tempfile.mkdtemp()
+        # Cache and media are separate too, so benchmark neither sees nor leaves anything behind
+        isolated = override_settings(
+            MEDIA_ROOT=media_root, ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'],
+            BLOG_IMAGE_WORKERS=0, BLOG_PROFILING=False,
+            BLOG_PAGE_CACHE_TIMEOUT=0 if options['no_page_cache'] else 600,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}})
+        isolated.enable()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            rng = random.Random(options['seed'])
+            start = time.time()
+            seed(options, rng)
+            self.stdout.write('Seeded %d posts, %d tags, %d images and %d pages in %.2f s' % (
+                options['posts'], options['tags'], options['images'], options['pages'], time.time() - start))
+
+            results = self.run(options, rng)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            isolated.disable()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.report(results, baseline)
+        if options['output']:
+            write_atomic(options['output'], json.dumps(results, indent=2, sort_keys=True).encode('utf-8'))
+
+    def run(self, options, rng):
+        paths = make_paths(rng)
+        client = Client()
+        endpoints = {}
+        for name in ENDPOINTS:
+            measure(client, [paths[name]() for _ in range(options['warmup'])])
+            endpoints[name] = summary(*measure(client, [paths[name]() for _ in range(options['requests'])]))
+
+        return {
+            'commit': git_commit(),
+            'date': timezone.now().replace(microsecond=0).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'corpus': dict((key, options[key]) for key in ('posts', 'tags', 'images', 'pages', 'seed')),
+            'page_cache': not options['no_page_cache'],
+            'endpoints': endpoints,
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write('%-15s %9s %9s %9s %9s %8s' % ('endpoint', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for name in ENDPOINTS:
+            result = results['endpoints'][name]
+            line = '%-15s %9.1f %9.2f %9.2f %9.2f %8.1f' % (
+                name, result['rps'], result['p50'], result['p95'], result['p99'], result['queries'])
+            if baseline is not None and name in baseline['endpoints']:
+                before = baseline['endpoints'][name]
+                line += '   p95 %+.1f%%, queries %+.1f' % (
+                    100.0 * (result['p95'] - before['p95']) / before['p95'], result['queries'] - before['queries'])
+            self.stdout.write(line)
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from functools import partial
+from math import ceil
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from blog import views
+from blog.models import Post, Page, SocialLink, TaggedPost
+from blog.utils import write_atomic
+
+MANIFEST = '.export-manifest.json'
+
+
+def render_path(path, output, host, secure):
+    """Renders path through the regular view as anonymous reader and writes it to the output directory"""
+    request = RequestFactory(SERVER_NAME=host).get(path, secure=secure)
+    request.user = AnonymousUser()
+    match = resolve(path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code != 200:
+        return path, None
+
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    name = 'index.xml' if 'xml' in response['Content-Type'] else 'index.html'
+    write_atomic(os.path.join(output, path.lstrip('/'), name), content)
+    return path, len(content)
+
+
+def digest(*values):
+    return hashlib.sha1(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+
+def snapshot():
+    """Returns hashes of everything which is rendered, used to find changes since the last export"""
+    tags = {}
+    for post_slug, tag_slug in TaggedPost.objects.filter(published=True).values_list('post__slug', 'tag__slug'):
+        tags.setdefault(post_slug, []).append(tag_slug)
+
+    posts = Post.objects.filter(published=True).order_by('-pub_date', '-pk').values_list(
+        'slug', 'title', 'show_title', 'title_size', 'title_background', 'fullwidth', 'image__image',
+        'category__name', 'category__image', 'read_time', 'pub_date', 'content')
+    order = []
+    hashes = {}
+    for row in posts.iterator():
+        order.append(row[0])
+        hashes[row[0]] = digest(row, sorted(tags.get(row[0], [])))
+
+    return {
+        'chrome': digest(list(Page.objects.order_by('order').values_list('slug', 'title')),
+                         list(SocialLink.objects.order_by('order').values_list('slug', 'tooltip', 'url', 'image')),
+                         settings.ANALYTICS),
+        'order': order,
+        'posts': hashes,
+        'tags': dict((slug, sorted(post_tags)) for slug, post_tags in tags.items()),
+        'pages': dict((slug, digest(title, content)) for slug, title, content
+                      in Page.objects.values_list('slug', 'title', 'content')),
+    }
+
+
+def pages_count(posts):
+    return max(1, int(ceil(posts / views.POSTS_PER_PAGE)))
+
+
+def tag_sizes(state):
+    sizes = {}
+    for post_tags in state['tags'].values():
+        for tag_slug in post_tags:
+            sizes[tag_slug] = sizes.get(tag_slug, 0) + 1
+    return sizes
+
+
+def index_paths(first, last):
+    paths = [reverse('index_pagination', args=[n]) for n in range(first, last + 1)]
+    if first == 1:
+        paths.append(reverse('index'))
+    return paths
+
+
+def tag_paths(tag_slug, posts):
+    paths = [reverse('tag', args=[tag_slug]), reverse('rss_tag', args=[tag_slug])]
+    paths += [reverse('tag_pagination', args=[tag_slug, n]) for n in range(1, pages_count(posts) + 1)]
+    return paths
+
+
+class Command(BaseCommand):
+    help = 'Renders the whole blog into static files which can be served directly by nginx'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Directory for rendered files')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Render only pages affected by changes since the last export')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Number of rendering processes')
+        parser.add_argument('--host', help='Host used in absolute links, first of ALLOWED_HOSTS by default')
+        parser.add_argument('--http', action='store_true', help='Use http instead of https in absolute links')
+
+    def handle(self, *args, **options):
+        output = os.path.abspath(options['output'])
+        manifest = os.path.join(output, MANIFEST)
+        previous = None
+        if options['incremental'] and os.path.exists(manifest):
+            with open(manifest) as f:
+                previous = json.load(f)
+
+        state = snapshot()
+        if previous is None or previous['chrome'] != state['chrome']:
+            paths = self.all_paths(state)
+        else:
+            paths = self.changed_paths(previous, state)
+        stale = self.stale_paths(previous, state) if previous else []
+
+        start = time.time()
+        written = self.render(sorted(set(paths)), output, options)
+        for path in stale:
+            shutil.rmtree(os.path.join(output, path.lstrip('/')), ignore_errors=True)
+        write_atomic(manifest, json.dumps(state).encode('utf-8'))
+
+        elapsed = time.time() - start
+        self.stdout.write('Rendered %d pages (%d bytes) and removed %d in %.2f s' % (
+            len(written), sum(written.values()), len(stale), elapsed))
+
+    def all_paths(self, state):
+        paths = index_paths(1, pages_count(len(state['order'])))
+        paths += [reverse('post', args=[slug]) for slug in state['order']]
+        paths += [reverse('page', args=[slug]) for slug in state['pages']]
+        for tag_slug, posts in tag_sizes(state).items():
+            paths += tag_paths(tag_slug, posts)
+        paths.append(reverse('rss_index'))
+        return paths
+
+    def changed_paths(self, previous, state):
+        changed = [slug for slug, digest in state['posts'].items() if previous['posts'].get(slug) != digest]
+        removed = [slug for slug in previous['posts'] if slug not in state['posts']]
+
+        paths = [reverse('post', args=[slug]) for slug in changed]
+        paths += [reverse('page', args=[slug]) for slug, digest in state['pages'].items()
+                  if previous['pages'].get(slug) != digest]
+        if not changed and not removed:
+            return paths
+
+        # Index pages after the first changed post could shift, so they are rendered again
+        positions = [state['order'].index(slug) for slug in changed]
+        positions += [previous['order'].index(slug) for slug in removed]
+        first = min(positions) // views.POSTS_PER_PAGE + 1
+        paths += index_paths(first, pages_count(len(state['order'])))
+        paths.append(reverse('rss_index'))
+
+        sizes = tag_sizes(state)
+        for slug in changed + removed:
+            for tag_slug in set(state['tags'].get(slug, []) + previous['tags'].get(slug, [])):
+                if tag_slug in sizes:
+                    paths += tag_paths(tag_slug, sizes[tag_slug])
+        return paths
+
+    def stale_paths(self, previous, state):
+        """Returns paths of directories which were exported before, but are gone now"""
+        paths = [reverse('post', args=[slug]) for slug in previous['posts'] if slug not in state['posts']]
+        paths += [reverse('page', args=[slug]) for slug in previous['pages'] if slug not in state['pages']]
+
+        last = pages_count(len(state['order']))
+        paths += index_paths(last + 1, pages_count(len(previous['order'])))
+
+        sizes = tag_sizes(state)
+        for tag_slug, posts in tag_sizes(previous).items():
+            if tag_slug not in sizes:
+                paths.append(reverse('tag', args=[tag_slug]))
+            else:
+                paths += [reverse('tag_pagination', args=[tag_slug, n])
+                          for n in range(pages_count(sizes[tag_slug]) + 1, pages_count(posts) + 1)]
+        return paths
+
+    def render(self, paths, output, options):
+        host = options['host']
+        if host is None:
+            hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+            host = hosts[0].lstrip('.') if hosts else 'localhost'
+        render = partial(render_path, output=output, host=host, secure=not options['http'])
+
+        if options['processes'] > 1 and len(paths) > 1:
+            # Every worker has to open its own database connection
+            connections.close_all()
+            pool = multiprocessing.Pool(options['processes'])
+            try:
+                results = list(pool.imap_unordered(render, paths, chunksize=8))
+            finally:
+                pool.terminate()
+        else:
+            results = [render(path) for path in paths]
+
+        failed = [path for path, size in results if size is None]
+        if failed:
+            raise CommandError('Could not render: %s' % ', '.join(failed))
+        return dict(results)
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand
+from pilkit.utils import open_image
+
+from blog.images import is_pending
+from blog.imagekit import optimize
+from blog.models import HeaderImage, Category, SocialLink
+from blog.utils import write_atomic
+
+MODELS = [HeaderImage, Category, SocialLink]
+
+
+def optimize_file(job):
+    """Saves processed image again with optimize() in worker process, returns sizes before and after"""
+    path, format, options, budget = job
+    with open(path, 'rb') as f:
+        content = f.read()
+        f.seek(0)
+        img = open_image(f)
+        img.load()
+
+    optimized = optimize(img, format, dict(options or {}), budget).getvalue()
+    if len(optimized) >= len(content):
+        return len(content), len(content)
+    write_atomic(path, optimized)
+    return len(content), len(optimized)
+
+
+class Command(BaseCommand):
+    help = 'Optimizes already processed images (header images, category and social link icons) in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of optimizing processes, 1 optimizes in this process')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in MODELS:
+            field = model._meta.get_field('image')
+            spec = field.get_spec(source=None)
+            for name in model.objects.exclude(image='').values_list('image', flat=True):
+                # Pending images will be optimized when they are processed
+                if not is_pending(name) and field.storage.exists(name):
+                    jobs.append((field.storage.path(name), spec.format, spec.options, spec.budget))
+
+        if options['workers'] > 1 and len(jobs) > 1:
+            # Workers only read and write files, they never touch the database
+            pool = multiprocessing.Pool(options['workers'])
+            try:
+                sizes = pool.map(optimize_file, jobs)
+            finally:
+                pool.terminate()
+        else:
+            sizes = [optimize_file(job) for job in jobs]
+
+        before = sum(size for size, optimized in sizes)
+        after = sum(optimized for size, optimized in sizes)
+        self.stdout.write('Optimized %d of %d images, saved %d bytes (%.1f%%)' % (
+            sum(1 for size, optimized in sizes if optimized < size), len(sizes),
+            before - after, 100.0 * (before - after) / before if before else 0))
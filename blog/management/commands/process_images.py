@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import images
+from blog.models import HeaderImage, Category, SocialLink
+
+MODELS = [HeaderImage, Category, SocialLink]
+
+
+def pending(model):
+    return model.objects.filter(image__contains='/%s/' % images.PENDING_DIR)
+
+
+class Command(BaseCommand):
+    help = 'Reports images waiting for background processing, optionally processes them right away'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--run', action='store_true',
+                            help='Process pending images in this process, e.g. ones left after restart')
+
+    def handle(self, *args, **options):
+        if options['run']:
+            start = time.time()
+            done = 0
+            for model in MODELS:
+                for pk in list(pending(model).values_list('pk', flat=True)):
+                    if images.process(model, pk, 'image') is not None:
+                        done += 1
+            self.stdout.write('Processed %d images in %.2f s' % (done, time.time() - start))
+
+        stats = images.stats()
+        self.stdout.write('Pending: %d' % sum(pending(model).count() for model in MODELS))
+        self.stdout.write('Queued: %d, processed: %d, failed: %d, average time: %.2f s' % (
+            stats['queued'], stats['processed'], stats['failed'], stats['average']))
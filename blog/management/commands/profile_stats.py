@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import profiling
+from blog.cache import is_shared_cache
+
+
+class Command(BaseCommand):
+    help = 'Shows p50 and p95 of metrics collected by ProfilingMiddleware for every blog view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--histograms', action='store_true', help='Show whole histograms of requests')
+        parser.add_argument('--reset', action='store_true', help='Clear collected histograms afterwards')
+
+    def handle(self, *args, **options):
+        if not is_shared_cache():
+            raise CommandError('Histograms are in local memory of web workers, set CACHES shared by all processes')
+
+        metrics = ['total', 'db', 'queries', 'template', 'context', 'images']
+        self.stdout.write('Values are upper bounds of histogram buckets')
+        self.stdout.write('%-16s %8s' % ('view', 'requests') + ''.join(' %16s' % metric for metric in metrics))
+        for view in profiling.profiled_views():
+            histograms = profiling.histograms(view)
+            requests = sum(histograms['total'])
+            if not requests:
+                continue
+
+            columns = []
+            for metric in metrics:
+                unit = '' if metric == 'queries' else 'ms'
+                columns.append(' %16s' % '/'.join(
+                    self.bound(metric, profiling.percentile(metric, histograms[metric], percent), unit)
+                    for percent in (50, 95)))
+            self.stdout.write('%-16s %8d' % (view, requests) + ''.join(columns))
+
+            if options['histograms']:
+                for metric in metrics:
+                    buckets = profiling.METRICS[metric][1]
+                    labels = ['<=%d' % value for value in buckets] + ['>%d' % buckets[-1]]
+                    self.stdout.write('  %-10s %s' % (metric, ' '.join(
+                        '%s:%d' % (label, count) for label, count in zip(labels, histograms[metric]) if count)))
+
+            if options['reset']:
+                profiling.reset(view)
+
+    def bound(self, metric, value, unit):
+        if value is None:
+            return '>%d%s' % (profiling.METRICS[metric][1][-1], unit)
+        return '%d%s' % (value, unit)
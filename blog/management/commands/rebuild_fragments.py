@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.cache import bump_version
+from blog.fragments import refresh_fragments
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Renders listing fragments of posts again, run it after changing preview.html or widget.html'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Ids of posts to rebuild, all posts by default')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of posts saved by single query')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk').select_related('image', 'category').prefetch_related('tags').defer(
+            'raw_content', 'content', 'excerpt', 'preview_html', 'widget_html')
+        if options['ids']:
+            posts = posts.filter(pk__in=options['ids'])
+
+        start = time.time()
+        done = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            refresh_fragments(batch)
+            done += len(batch)
+
+        # Fragments are on every listing, so all cached responses are dropped
+        bump_version('posts')
+        bump_version('site')
+        self.stdout.write('Rebuilt fragments of %d posts in %.2f s' % (done, time.time() - start))
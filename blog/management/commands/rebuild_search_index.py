@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.search import backend, clear_index, index_posts
+
+
+class Command(BaseCommand):
+    help = 'Builds search index of all posts again, run it after changing BLOG_SEARCH_BACKEND'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of posts indexed at once')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk').only('title', 'raw_content')
+
+        start = time.time()
+        clear_index()
+        done = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            index_posts(batch)
+            done += len(batch)
+
+        self.stdout.write('Indexed %d posts with %s backend in %.2f s' % (done, backend(), time.time() - start))
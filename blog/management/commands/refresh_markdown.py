@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Case, TextField, Value, When
+from django.urls import reverse
+
+from blog.cache import bump_version
+from blog.markdown import render_markdown
+from blog.models import Post, make_excerpt
+from blog.purge import purge_paths
+
+
+def render_post(row):
+    """Renders single post in worker process"""
+    pk, slug, raw_content = row
+    content = render_markdown(raw_content)
+    return pk, slug, content, make_excerpt(content)
+
+
+def save_batch(batch):
+    """Updates content of many posts with a single UPDATE query"""
+    Post.objects.filter(pk__in=[pk for pk, slug, content, excerpt in batch]).update(
+        content=Case(*[When(pk=pk, then=Value(content)) for pk, slug, content, excerpt in batch],
+                     output_field=TextField()),
+        excerpt=Case(*[When(pk=pk, then=Value(excerpt)) for pk, slug, content, excerpt in batch],
+                     output_field=TextField()))
+    purge_paths([reverse('post', args=[slug]) for pk, slug, content, excerpt in batch])
+
+
+class Command(BaseCommand):
+    help = 'Renders markdown of posts again in parallel and saves it in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Ids of posts to refresh, all posts by default')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of posts saved by single query')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of rendering processes, 1 renders in this process')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk')
+        if options['ids']:
+            posts = posts.filter(pk__in=options['ids'])
+        total = posts.count()
+
+        pool = None
+        render = map
+        if options['workers'] > 1 and total > 1:
+            # Workers only render, they never touch the database
+            pool = multiprocessing.Pool(options['workers'])
+            render = pool.imap
+
+        start = time.time()
+        done = 0
+        last_pk = 0
+        try:
+            while True:
+                # Batch is read to the end before UPDATE, so no cursor stays open while writing
+                rows = list(posts.filter(pk__gt=last_pk).values_list('pk', 'slug', 'raw_content')
+                            [:options['batch_size']].iterator())
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+
+                save_batch(list(render(render_post, rows)))
+                done += len(rows)
+                elapsed = time.time() - start
+                self.stdout.write('%d/%d posts (%.1f posts/s)' % (done, total, done / elapsed if elapsed else 0))
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        bump_version('posts')
+        elapsed = time.time() - start
+        self.stdout.write('Refreshed %d posts in %.2f s (%.1f posts/s)' % (
+            done, elapsed, done / elapsed if elapsed else 0))
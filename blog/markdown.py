@@ -1,11 +1,48 @@
+import hashlib
 import logging
 import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 from django.template import engines
-from mistune import Renderer, InlineLexer
+from mistune import Markdown, Renderer, InlineLexer
 
 logger = logging.getLogger(__name__)
 
+# Number of rendered posts kept in memory by render_markdown
+RENDER_CACHE_SIZE = 256
+
+# Building blocks of custom tags. Each character class excludes the delimiter closing the group,
+# so patterns never backtrack and match in linear time. One level of nested brackets is allowed.
+BRACKETED = r'((?:[^\[\]\n]|\[[^\[\]\n]*\])*)'
+PARENTHESIZED = r'((?:[^()\n]|\([^()\n]*\))*)'
+
+GALLERY_TEMPLATE = """
+        <div class="gallery less">
+          <div class="gallery-content mdl-grid">
+            <div class="gallery-shadow"></div>
+            {% for link in links %}
+            <div class="mdl-cell mdl-cell--4-col">
+              <img src="{{ link }}">
+            </div>
+            {% endfor %}
+          </div>
+          <div class="gallery-more">
+            <button><i class="material-icons">expand_more</i></button>
+          </div>
+          <div class="gallery-less">
+            <button><i class="material-icons">expand_less</i></button>
+          </div>
+        </div>
+        """
+
+
+@lru_cache(maxsize=None)
+def gallery_template():
+    """Returns gallery template compiled once per process"""
+    return engines['django'].from_string(GALLERY_TEMPLATE)
+
 class PostRenderer(Renderer):
     def figure(self, text, link, alt):
         return '<figure><img src="%s" alt="%s" /><div>%s</div></figure>' % (link, alt, text)
@@ -27,27 +64,7 @@ class PostRenderer(Renderer):
                ''' % (color, link, clazz, icon, text)
 
     def gallery(self, links):
-        gallery_template = """
-        <div class="gallery less">
-          <div class="gallery-content mdl-grid">
-            <div class="gallery-shadow"></div>
-            {% for link in links %}
-            <div class="mdl-cell mdl-cell--4-col">
-              <img src="{{ link }}">
-            </div>
-            {% endfor %}
-          </div>
-          <div class="gallery-more">
-            <button><i class="material-icons">expand_more</i></button>
-          </div>
-          <div class="gallery-less">
-            <button><i class="material-icons">expand_less</i></button>
-          </div>
-        </div>
-        """
-
-        django_engine = engines['django']
-        return django_engine.from_string(gallery_template).render({
+        return gallery_template().render({
             'links': links
         })
 
@@ -57,7 +74,8 @@ class PostInlineLexer(InlineLexer):
         # Syntax for 'woo' element
         # !F[text][icon name][color without #][class (can be empty)](link)
         self.rules.woo = re.compile(
-            r'!F\[(.*)\]\[(.*)\]\[(.*)\]\[(.*)\]\((.*)\)'
+            r'!F\[' + BRACKETED + r'\]\[' + BRACKETED + r'\]\[' + BRACKETED + r'\]\[' + BRACKETED + r'\]'
+            r'\(' + PARENTHESIZED + r'\)'
         )
         self.default_rules.insert(3, 'woo')
 
@@ -80,7 +98,7 @@ class PostInlineLexer(InlineLexer):
 
     def enable_figure(self):
         self.rules.figure = re.compile(
-            r'!\[(.*)\]\[(.*)\]\((.*)\)'
+            r'!\[' + BRACKETED + r'\]\[' + BRACKETED + r'\]\(' + PARENTHESIZED + r'\)'
         )
         self.default_rules.insert(3, 'figure')
 
@@ -91,10 +109,43 @@ class PostInlineLexer(InlineLexer):
         return self.renderer.figure(text, link, alt)
 
     def enable_gallery(self):
-        self.rules.gallery = re.compile(r'Gallery\[(.*)\]')
+        self.rules.gallery = re.compile(r'Gallery\[' + BRACKETED + r'\]')
         self.default_rules.insert(3, 'gallery')
 
     def output_gallery(self, m):
         inside = m.group(1)
 
         return self.renderer.gallery([link.strip() for link in inside.split(',')])
+
+
+@lru_cache(maxsize=None)
+def get_markdown():
+    """Returns markdown pipeline with all custom tags enabled, built once per process"""
+    renderer = PostRenderer()
+    inline = PostInlineLexer(renderer)
+    inline.enable_woo()
+    inline.enable_emdash()
+    inline.enable_figure()
+    inline.enable_gallery()
+
+    return Markdown(renderer, inline=inline, escape=False)
+
+
+# Rendered posts keyed by hash of raw content, mistune pipeline isn't thread safe so both share the lock
+_rendered = OrderedDict()
+_render_lock = threading.Lock()
+
+
+def render_markdown(raw_content):
+    """Renders post content, unchanged content is taken from memory instead of being parsed again"""
+    key = hashlib.sha1(raw_content.encode('utf-8')).hexdigest()
+    with _render_lock:
+        if key in _rendered:
+            _rendered.move_to_end(key)
+            return _rendered[key]
+
+        content = get_markdown()(raw_content)
+        _rendered[key] = content
+        if len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
+        return content
@@ -0,0 +1,30 @@
+# Generated by Django 2.0.1 on 2026-10-18 20:35
+
+from html import unescape
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+def fill_excerpts(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    for pk, content in Post.objects.values_list('pk', 'content').iterator():
+        text = ' '.join(unescape(strip_tags(content)).split())
+        Post.objects.filter(pk=pk).update(excerpt=Truncator(text).words(50).strip())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_auto_20180812_1845'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, default='', verbose_name='Zajawka'),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
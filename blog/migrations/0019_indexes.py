@@ -0,0 +1,65 @@
+# Generated by Django 2.0.1 on 2026-10-18 20:43
+
+from django.db import migrations, models
+
+
+# max_length of SlugField
+SLUG_LENGTH = 50
+
+
+def free_slug(model, slug, pk, seen):
+    """Returns slug with suffix which no other object has, shortened to fit in the column"""
+    number = 0
+    while True:
+        suffix = '-%d' % pk if not number else '-%d-%d' % (pk, number)
+        candidate = slug[:SLUG_LENGTH - len(suffix)] + suffix
+        if candidate not in seen and not model.objects.filter(slug=candidate).exists():
+            return candidate
+        number += 1
+
+
+def deduplicate_slugs(apps, schema_editor):
+    """Unique slugs can't be added while there are duplicates, the oldest object keeps its slug"""
+    for model_name, fallback in [('Post', 'post'), ('Page', 'page')]:
+        model = apps.get_model('blog', model_name)
+        seen = set()
+        for pk, slug in model.objects.order_by('pk').values_list('pk', 'slug'):
+            if slug in seen or not slug:
+                slug = free_slug(model, slug or fallback, pk, seen)
+                model.objects.filter(pk=pk).update(slug=slug)
+            seen.add(slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0018_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='page',
+            name='order',
+            field=models.IntegerField(db_index=True, default=10, verbose_name='Kolejność'),
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='slug',
+            field=models.SlugField(default='', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='slug',
+            field=models.SlugField(default='', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='sociallink',
+            name='order',
+            field=models.IntegerField(db_index=True, default=10, verbose_name='Kolejność'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['published', 'pub_date'], name='blog_post_published_pub_idx'),
+        ),
+    ]
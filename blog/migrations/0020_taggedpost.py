@@ -0,0 +1,54 @@
+# Generated by Django 2.0.1 on 2026-10-18 20:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_index(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    Post = apps.get_model('blog', 'Post')
+    TaggedPost = apps.get_model('blog', 'TaggedPost')
+
+    content_type = ContentType.objects.filter(app_label='blog', model='post').first()
+    if content_type is None:
+        return
+
+    posts = dict((pk, (published, pub_date)) for pk, published, pub_date
+                 in Post.objects.values_list('pk', 'published', 'pub_date').iterator())
+    tagged = TaggedItem.objects.filter(content_type=content_type).values_list('tag_id', 'object_id').distinct()
+    TaggedPost.objects.bulk_create([
+        TaggedPost(tag_id=tag_id, post_id=object_id, published=posts[object_id][0], pub_date=posts[object_id][1])
+        for tag_id, object_id in tagged if object_id in posts
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0002_auto_20150616_2121'),
+        ('blog', '0019_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaggedPost',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published', models.BooleanField(default=False)),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_index', to='blog.Post')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='taggit.Tag')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taggedpost',
+            index=models.Index(fields=['tag', 'published', 'pub_date'], name='blog_taggedpost_listing_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='taggedpost',
+            unique_together={('tag', 'post')},
+        ),
+        migrations.RunPython(fill_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.0.1 on 2026-10-18 20:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counts(apps, schema_editor):
+    TaggedPost = apps.get_model('blog', 'TaggedPost')
+    TagCount = apps.get_model('blog', 'TagCount')
+
+    counts = TaggedPost.objects.filter(published=True).values('tag_id').annotate(count=models.Count('post_id'))
+    TagCount.objects.bulk_create([TagCount(tag_id=row['tag_id'], count=row['count']) for row in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taggit', '0002_auto_20150616_2121'),
+        ('blog', '0020_taggedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='taggit.Tag')),
+                ('count', models.IntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
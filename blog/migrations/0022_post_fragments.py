@@ -0,0 +1,36 @@
+# Generated by Django 2.0.1 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+def legacy_alter_table(enabled):
+    """
+    SQLite 3.26+ rewrites foreign keys of other tables when blog_post is renamed
+    while being rebuilt, which leaves them pointing at blog_post__old in Django 2.0.1
+    """
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            schema_editor.execute('PRAGMA legacy_alter_table = %s' % ('ON' if enabled else 'OFF'))
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0021_tagcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(legacy_alter_table(True), legacy_alter_table(False)),
+        migrations.AddField(
+            model_name='post',
+            name='preview_html',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Podgląd na liście'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='widget_html',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Podgląd w tagach'),
+        ),
+        migrations.RunPython(legacy_alter_table(False), legacy_alter_table(True)),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.0.1 on 2026-10-18 20:53
+
+import blog.imagekit
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0022_post_fragments'),
+    ]
+
+    # Columns stay the same, only the Python field class changes
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='category',
+                name='image',
+                field=blog.imagekit.BackgroundProcessedImageField(upload_to='images/categories', verbose_name='Ikonka'),
+            ),
+            migrations.AlterField(
+                model_name='headerimage',
+                name='image',
+                field=blog.imagekit.BackgroundProcessedImageField(upload_to='images/posts', verbose_name='Obrazek'),
+            ),
+            migrations.AlterField(
+                model_name='sociallink',
+                name='image',
+                field=blog.imagekit.BackgroundProcessedImageField(default='', upload_to='images/social_links', verbose_name='Ikona'),
+            ),
+        ]),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 2.0.1 on 2026-10-18 21:13
+
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import migrations, models, transaction
+from django.db.utils import OperationalError
+import django.db.models.deletion
+
+# Copied from blog.search as it was when the index was created, so later changes there don't change this migration
+FTS_TABLE = 'blog_post_fts'
+TITLE_WEIGHT = 10
+MAX_WORD_LENGTH = 100
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [word for word in re.findall(r'\w+', text) if len(word) <= MAX_WORD_LENGTH]
+
+
+def terms(title, content):
+    weights = Counter(tokenize(content))
+    for word in tokenize(title):
+        weights[word] += TITLE_WEIGHT
+    return weights
+
+
+def create_index(apps, schema_editor):
+    """Creates full-text index of the database, SearchTerm rows are the fallback when there is none"""
+    Post = apps.get_model('blog', 'Post')
+    SearchTerm = apps.get_model('blog', 'SearchTerm')
+    connection = schema_editor.connection
+    if connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE blog_post ADD FULLTEXT INDEX blog_post_search_idx (title, raw_content)')
+        return
+
+    if connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute("CREATE VIRTUAL TABLE %s USING fts5(title, raw_content, tokenize = 'unicode61')"
+                                      % FTS_TABLE)
+                schema_editor.execute('INSERT INTO %s (rowid, title, raw_content) '
+                                      'SELECT id, title, raw_content FROM blog_post' % FTS_TABLE)
+            return
+        except OperationalError:
+            # SQLite built without FTS5
+            pass
+
+    for post in Post.objects.only('title', 'raw_content').iterator():
+        SearchTerm.objects.bulk_create([SearchTerm(term=term, post=post, weight=weight)
+                                        for term, weight in terms(post.title, post.raw_content).items()])
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE blog_post DROP INDEX blog_post_search_idx')
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0023_background_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.IntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='blog.Post')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchterm',
+            unique_together={('term', 'post')},
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
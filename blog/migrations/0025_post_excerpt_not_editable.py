@@ -0,0 +1,21 @@
+# Generated by Django 2.0.1 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0024_search'),
+    ]
+
+    operations = [
+        # Only the state changes, AlterField would rebuild whole blog_post table on SQLite
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='post',
+                name='excerpt',
+                field=models.TextField(blank=True, default='', editable=False, verbose_name='Zajawka'),
+            ),
+        ]),
+    ]
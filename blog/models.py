@@ -1,8 +1,13 @@
+from html import unescape
+
 from django.db import models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
 from taggit.managers import TaggableManager
-from imagekit.models import ImageSpecField, ProcessedImageField
-from imagekit.processors import ResizeToFit, ResizeToFill, ResizeCanvas
-from .imagekit import UpscaleToFit
+from taggit.models import Tag
+from imagekit.models import ImageSpecField
+from imagekit.processors import ResizeToFit, ResizeToFill
+from .imagekit import FillHeader, BackgroundProcessedImageField, optimized_spec
 
 post_help_text = """
 Markdown editor with some special tags:</br>
@@ -11,21 +16,60 @@ Markdown editor with some special tags:</br>
 !F[text][icon name][color without #][class (can be empty)](link)</br>
 """
 
+EXCERPT_WORDS = 50
+
+
+def variant(width, height, format):
+    """Returns field with smaller version of the image, generated on first use and cached by imagekit"""
+    return ImageSpecField(source='image', spec=optimized_spec([ResizeToFill(width, height)], format, {'quality': 80}))
+
+
+def srcset(instance, widths, suffix='', original=None):
+    """
+    Returns srcset attribute of image variants named image_<width><suffix>
+
+    :param original: width of the processed image itself, if it should be included
+    """
+    if not instance.image.ready:
+        return ''
+    sources = ['%s %dw' % (getattr(instance, 'image_%d%s' % (width, suffix)).url, width) for width in widths]
+    if original is not None:
+        sources.append('%s %dw' % (instance.image.url, original))
+    return ', '.join(sources)
+
+
+def make_excerpt(content):
+    """Returns plain text beginning of rendered post content"""
+    text = ' '.join(unescape(strip_tags(content)).split())
+    return Truncator(text).words(EXCERPT_WORDS).strip()
+
+
 class Category(models.Model):
     name = models.CharField(max_length=200, verbose_name="Nazwa")
-    image = ProcessedImageField(
+    image = BackgroundProcessedImageField(
         upload_to='images/categories',
         verbose_name="Ikonka",
         processors=[ResizeToFill(128, 128, upscale=False)],
         format='JPEG',
-        options={'quality': 80})
+        options={'quality': 80},
+        budget=8 * 1024)
+    image_64 = variant(64, 64, 'JPEG')
+    image_64_webp = variant(64, 64, 'WEBP')
+    image_128_webp = variant(128, 128, 'WEBP')
+
     def __str__(self):
         return self.name
 
+    def srcset(self):
+        return srcset(self, [64], original=128)
+
+    def webp_srcset(self):
+        return srcset(self, [64, 128], suffix='_webp')
+
 
 class Post(models.Model):
     title = models.CharField(max_length=200, verbose_name="Tytuł")
-    slug = models.SlugField(default='')
+    slug = models.SlugField(default='', unique=True)
     show_title = models.BooleanField(verbose_name="Pokaż tytuł", default=True)
     title_size = models.IntegerField(default=42, verbose_name="Wielkość tytułu (px)")
     title_background = models.CharField(
@@ -46,18 +90,94 @@ class Post(models.Model):
     pub_date = models.DateTimeField(verbose_name="Data publikacji")
     raw_content = models.TextField(verbose_name="Zawartość surowa", help_text=post_help_text)
     content = models.TextField(verbose_name="Zawartość", default='', blank=True)
+    excerpt = models.TextField(verbose_name="Zajawka", default='', blank=True, editable=False)
+    preview_html = models.TextField(verbose_name="Podgląd na liście", default='', blank=True, editable=False)
+    widget_html = models.TextField(verbose_name="Podgląd w tagach", default='', blank=True, editable=False)
     published = models.BooleanField(verbose_name="Opublikowany", default=False)
     tags = TaggableManager()
 
+    class Meta:
+        indexes = [
+            # Every public listing filters published posts ordered by pub_date
+            models.Index(fields=['published', 'pub_date'], name='blog_post_published_pub_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
 
+class TaggedPost(models.Model):
+    """
+    Denormalized index of posts with given tag, kept in sync by signals
+
+    Tag listings and feeds read it with a single range scan instead of joining
+    through generic TaggedItem.
+    """
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='tag_index')
+    published = models.BooleanField(default=False)
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('tag', 'post')
+        indexes = [
+            models.Index(fields=['tag', 'published', 'pub_date'], name='blog_taggedpost_listing_idx'),
+        ]
+
+    @classmethod
+    def sync(cls, posts):
+        """Copies publication state of given posts to the index"""
+        for post in posts:
+            entries = cls.objects.filter(post_id=post.pk)
+            flipped = list(entries.exclude(published=post.published).values_list('tag_id', flat=True))
+            entries.update(published=post.published, pub_date=post.pub_date)
+            TagCount.adjust(flipped, 1 if post.published else -1)
+
+
+class TagCount(models.Model):
+    """Number of published posts with given tag, maintained incrementally for the tag cloud"""
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    count = models.IntegerField(default=0, db_index=True)
+
+    @classmethod
+    def adjust(cls, tag_ids, delta):
+        if not tag_ids:
+            return
+        if delta > 0:
+            # Missing counts can only go down when tag is being deleted, so they are created only here
+            for tag_id in set(tag_ids) - set(cls.objects.filter(tag_id__in=tag_ids).values_list('tag_id', flat=True)):
+                cls.objects.get_or_create(tag_id=tag_id)
+        cls.objects.filter(tag_id__in=tag_ids).update(count=models.F('count') + delta)
+
+    @classmethod
+    def most_common(cls, number):
+        """Returns given number of tags with the most published posts, like Post.tags.most_common does"""
+        tags = []
+        for tag_count in cls.objects.filter(count__gt=0).select_related('tag').order_by('-count')[:number]:
+            tag_count.tag.num_times = tag_count.count
+            tags.append(tag_count.tag)
+        return tags
+
+
+class SearchTerm(models.Model):
+    """
+    Inverted index of words in posts, used by blog.search on databases without full-text search
+
+    Weight is number of occurrences of the word, occurrences in title count more.
+    """
+    term = models.CharField(max_length=100)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.IntegerField()
+
+    class Meta:
+        unique_together = ('term', 'post')
+
+
 class Page(models.Model):
     title = models.CharField(max_length=200, verbose_name="Tytuł")
-    slug = models.SlugField(default='')
+    slug = models.SlugField(default='', unique=True)
     content = models.TextField(verbose_name="Zawartość")
-    order = models.IntegerField(verbose_name="Kolejność", default=10)
+    order = models.IntegerField(verbose_name="Kolejność", default=10, db_index=True)
 
     def __str__(self):
         return self.title
@@ -67,22 +187,36 @@ class SocialLink(models.Model):
     slug = models.SlugField(default='')
     tooltip = models.CharField(max_length=200, verbose_name="Podpis")
     url = models.URLField(verbose_name="Adres linku")
-    image = ProcessedImageField(
+    image = BackgroundProcessedImageField(
         upload_to='images/social_links',
         default='',
         verbose_name="Ikona",
         processors=[ResizeToFit(300, 300)],
         format='PNG')
-    order = models.IntegerField(verbose_name="Kolejność", default=10)
+    order = models.IntegerField(verbose_name="Kolejność", default=10, db_index=True)
 
 
 class HeaderImage(models.Model):
-    image = ProcessedImageField(
+    image = BackgroundProcessedImageField(
         upload_to='images/posts',
         verbose_name="Obrazek",
-        processors=[ResizeToFill(1024, 576, upscale=False), UpscaleToFit(
-            512, 288), ResizeCanvas(1024, 576, color=(255, 255, 255))],
+        processors=[FillHeader(1024, 576, 512, 288, color=(255, 255, 255))],
         format='JPEG',
-        options={'quality': 80})
+        options={'quality': 80},
+        budget=120 * 1024)
+    image_256 = variant(256, 144, 'JPEG')
+    image_512 = variant(512, 288, 'JPEG')
+    image_768 = variant(768, 432, 'JPEG')
+    image_256_webp = variant(256, 144, 'WEBP')
+    image_512_webp = variant(512, 288, 'WEBP')
+    image_768_webp = variant(768, 432, 'WEBP')
+    image_1024_webp = variant(1024, 576, 'WEBP')
+
     def __str__(self):
         return self.image.name
+
+    def srcset(self):
+        return srcset(self, [256, 512, 768], original=1024)
+
+    def webp_srcset(self):
+        return srcset(self, [256, 512, 768, 1024], suffix='_webp')
@@ -0,0 +1,92 @@
+from math import ceil
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .cache import get_version
+
+
+class KeysetPage(object):
+    """Page of posts compatible with the parts of Django's Page used in templates"""
+
+    def __init__(self, object_list, number, num_pages):
+        self.object_list = object_list
+        self.number = number
+        self.num_pages = num_pages
+
+    def __repr__(self):
+        return '<Page %s of %s>' % (self.number, self.num_pages)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.number < self.num_pages
+
+    def has_previous(self):
+        return self.number > 1
+
+
+class KeysetPaginator(object):
+    """
+    Paginates posts using (pub_date, id) keys instead of COUNT and OFFSET
+
+    Numeric page numbers are translated into keys with page-boundary index,
+    which holds key of the last post on every page. Index is built with a single
+    narrow query and cached until any post changes.
+    """
+
+    def __init__(self, queryset, per_page, name, key=('pub_date', 'pk')):
+        """
+        :param queryset: posts to paginate
+        :param per_page: number of posts on a single page
+        :param name: unique name of the listing, used as a part of cache key
+        :param key: date and unique id fields to order posts by, newest first
+        """
+        self.date_field, self.id_field = key
+        self.queryset = queryset.order_by('-' + self.date_field, '-' + self.id_field)
+        self.per_page = int(per_page)
+        self.name = name
+
+    def boundaries(self):
+        """Returns tuple of total number of posts and keys of the last post on each page"""
+        key = 'blog:keyset:%s:%s:%s' % (self.name, self.per_page, get_version('posts'))
+        index = cache.get(key)
+        if index is None:
+            count = 0
+            boundaries = []
+            keys = self.queryset.prefetch_related(None).values_list(self.date_field, self.id_field)
+            for count, post_key in enumerate(keys.iterator(), 1):
+                if count % self.per_page == 0:
+                    boundaries.append(post_key)
+            index = (count, boundaries)
+            cache.set(key, index)
+        return index
+
+    def page(self, number):
+        """Returns n-th page, pages out of range are replaced by the last one like Paginator.get_page does"""
+        count, boundaries = self.boundaries()
+        num_pages = max(1, int(ceil(count / self.per_page)))
+        if number < 1 or number > num_pages:
+            number = num_pages
+
+        posts = self.queryset
+        if number > 1:
+            date, id = boundaries[number - 2]
+            posts = posts.filter(Q(**{self.date_field + '__lt': date}) |
+                                 Q(**{self.date_field: date, self.id_field + '__lt': id}))
+
+        # One extra row tells if there is next page without counting
+        posts = list(posts[:self.per_page + 1])
+        if len(posts) > self.per_page:
+            num_pages = max(num_pages, number + 1)
+        else:
+            num_pages = number
+
+        return KeysetPage(posts[:self.per_page], number, num_pages)
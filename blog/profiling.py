@@ -0,0 +1,202 @@
+"""
+Opt-in profiling of blog views, enabled with BLOG_PROFILING setting
+
+For every request to a blog view ProfilingMiddleware measures database queries,
+template rendering, context processors and resolving URLs of image variants
+(which generates them when they don't exist yet). Timings are sent in Server-Timing
+header and counted in histograms kept in cache, see profile_stats command. The
+cache has to be shared with other processes, so the command can read histograms.
+Histograms are approximate, backends without atomic incr (like file based cache)
+may lose counts of concurrent requests.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connection
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.base import Template
+from imagekit.cachefiles import ImageCacheFile
+from imagekit.pkgmeta import __version__ as imagekit_version
+
+from .cache import increment, is_shared_cache
+
+# Upper bounds of histogram buckets, values above the last one go to an extra bucket
+TIME_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+
+# Metric: (description in Server-Timing, buckets), times are in milliseconds
+METRICS = {
+    'total': ('Total', TIME_BUCKETS),
+    'db': ('Database', TIME_BUCKETS),
+    'queries': ('Queries', QUERY_BUCKETS),
+    'template': ('Templates without context processors and images', TIME_BUCKETS),
+    'context': ('Context processors', TIME_BUCKETS),
+    'images': ('Image variants', TIME_BUCKETS),
+}
+
+_local = threading.local()
+_installed = False
+
+
+class Profile(object):
+    """Timings of a single request"""
+
+    def __init__(self):
+        self.seconds = {'db': 0.0, 'template': 0.0, 'context': 0.0, 'images': 0.0}
+        self.queries = 0
+        self._running = set()
+
+    @contextmanager
+    def measure(self, name):
+        # Included templates are rendered inside of the outer one, so only the outermost call counts
+        if name in self._running:
+            yield
+            return
+
+        self._running.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self._running.discard(name)
+
+    def record_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        with self.measure('db'):
+            return execute(sql, params, many, context)
+
+    def values(self, total):
+        """Returns metrics in milliseconds, except number of queries"""
+        return {
+            'total': total * 1000,
+            'db': self.seconds['db'] * 1000,
+            'queries': self.queries,
+            'template': max(0.0, self.seconds['template'] - self.seconds['context'] - self.seconds['images']) * 1000,
+            'context': self.seconds['context'] * 1000,
+            'images': self.seconds['images'] * 1000,
+        }
+
+
+def measured(function, name):
+    """Returns function which adds its time to the profile of current request"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        profile = getattr(_local, 'profile', None)
+        if profile is None:
+            return function(*args, **kwargs)
+        with profile.measure(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def install():
+    """Wraps template rendering, context processors and image variants, once per process"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    Template.render = measured(Template.render, 'template')
+    if imagekit_version.split('.')[0] == '4' and hasattr(ImageCacheFile, '_storage_attr'):
+        # Private method of imagekit 4 behind url, path etc., it checks existence of variants and generates them
+        ImageCacheFile._storage_attr = measured(ImageCacheFile._storage_attr, 'images')
+    else:
+        ImageCacheFile.generate = measured(ImageCacheFile.generate, 'images')
+    for engine in engines.all():
+        if isinstance(engine, DjangoTemplates):
+            engine.engine.template_context_processors = tuple(
+                measured(processor, 'context') for processor in engine.engine.template_context_processors)
+
+
+def profiled_views():
+    """Returns names of blog URLs, requests to other ones are not profiled"""
+    from . import urls
+    return [pattern.name for pattern in urls.urlpatterns if getattr(pattern, 'name', None)]
+
+
+def bucket(metric, value):
+    return bisect_left(METRICS[metric][1], value)
+
+
+def histogram_key(view, metric, index):
+    return 'blog:profile:%s:%s:%d' % (view, metric, index)
+
+
+def record(view, values):
+    for metric, value in values.items():
+        key = histogram_key(view, metric, bucket(metric, value))
+        increment(key)
+
+
+def histograms(view):
+    """Returns numbers of requests to the view in each bucket, by metric"""
+    keys = dict(((metric, index), histogram_key(view, metric, index))
+                for metric, (description, buckets) in METRICS.items() for index in range(len(buckets) + 1))
+    counts = cache.get_many(list(keys.values()))
+    return dict((metric, [counts.get(keys[metric, index], 0) for index in range(len(buckets) + 1)])
+                for metric, (description, buckets) in METRICS.items())
+
+
+def reset(view):
+    cache.delete_many([histogram_key(view, metric, index)
+                       for metric, (description, buckets) in METRICS.items() for index in range(len(buckets) + 1)])
+
+
+def percentile(metric, counts, percent):
+    """Returns upper bound of the bucket with given percentile, None if it's above the last bound"""
+    threshold = sum(counts) * percent / 100.0
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if count and seen >= threshold:
+            buckets = METRICS[metric][1]
+            return buckets[index] if index < len(buckets) else None
+    return None
+
+
+def server_timing(values):
+    parts = []
+    for metric in ('db', 'template', 'context', 'images', 'total'):
+        description = METRICS[metric][0]
+        if metric == 'db':
+            description = '%s (%d queries)' % (description, values['queries'])
+        parts.append('%s;desc="%s";dur=%.1f' % (metric, description, values[metric]))
+    return ', '.join(parts)
+
+
+class ProfilingMiddleware(object):
+    """Measures requests to blog views, put it first in MIDDLEWARE so total time covers other middleware"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BLOG_PROFILING', False):
+            raise MiddlewareNotUsed()
+        if not is_shared_cache():
+            raise ImproperlyConfigured('BLOG_PROFILING requires CACHES shared by all processes')
+        install()
+        self.get_response = get_response
+        self.views = set(profiled_views())
+
+    def __call__(self, request):
+        profile = _local.profile = Profile()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile.record_query):
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        total = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.url_name in self.views:
+            values = profile.values(total)
+            response['Server-Timing'] = server_timing(values)
+            record(match.url_name, values)
+        return response
@@ -0,0 +1,76 @@
+from math import ceil
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.urls import reverse
+
+from . import views
+from .cache import now_and_on_commit, response_key
+from .models import Post, TaggedPost
+
+
+def purge_paths(paths):
+    """Removes cached responses for given paths, again after commit"""
+    paths = list(paths)
+    now_and_on_commit(lambda: cache.delete_many([response_key(path) for path in paths]))
+
+
+def page_of(posts, pub_date, pk):
+    """Returns number of listing page on which post with given key is (or would be)"""
+    newer = posts.filter(Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)).count()
+    return newer // views.POSTS_PER_PAGE + 1
+
+
+def last_page(posts):
+    return max(1, int(ceil(posts.count() / views.POSTS_PER_PAGE)))
+
+
+def index_paths(first, last):
+    paths = [reverse('index_pagination', args=[n]) for n in range(first, last + 1)]
+    if first == 1:
+        paths.append(reverse('index'))
+    return paths
+
+
+def tag_paths(tag_slug):
+    """Returns paths of all listing pages of given tag"""
+    posts = TaggedPost.objects.filter(published=True, tag__slug=tag_slug)
+    paths = [reverse('tag_pagination', args=[tag_slug, n]) for n in range(1, last_page(posts) + 2)]
+    paths.append(reverse('tag', args=[tag_slug]))
+    return paths
+
+
+def purge_post(post, previous=None):
+    """
+    Purges cached responses showing given post: post itself, index pages it is on and its tags
+
+    :param post: saved post, or deleted one
+    :param previous: state of the post before change, None for new posts
+    """
+    paths = [reverse('post', args=[post.slug])]
+    if previous is not None and previous.slug != post.slug:
+        paths.append(reverse('post', args=[previous.slug]))
+
+    published = Post.objects.filter(published=True)
+    first = page_of(published, post.pub_date, post.pk)
+    if previous is not None and previous.published == post.published and previous.pub_date == post.pub_date:
+        # Post stayed in place, only its own page of the listing changed
+        last = first
+    else:
+        # Post appeared, disappeared or moved, so all older posts shifted
+        if previous is not None:
+            first = min(first, page_of(published, previous.pub_date, post.pk))
+        last = last_page(published) + 1
+    paths += index_paths(first, last)
+
+    for tag_slug in post.tags.values_list('slug', flat=True):
+        paths += tag_paths(tag_slug)
+
+    purge_paths(paths)
+
+
+def purge_tags(tag_slugs):
+    paths = []
+    for tag_slug in set(tag_slugs):
+        paths += tag_paths(tag_slug)
+    purge_paths(paths)
@@ -0,0 +1,165 @@
+"""
+Full-text search of posts
+
+Index is built from title and raw_content of posts. Depending on the database it's
+an FTS5 table (SQLite), FULLTEXT index (MySQL) or SearchTerm rows with words
+tokenized here, which works everywhere. Only the requested page of results is
+loaded, ranking is done by the database.
+"""
+import re
+import unicodedata
+from collections import Counter
+from math import log
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When
+
+from .models import Post, SearchTerm
+
+FTS_TABLE = 'blog_post_fts'
+
+# Occurrence of a word in title counts as that many occurrences in content
+TITLE_WEIGHT = 10
+
+# Further words of the query are ignored, every word makes the query slower
+MAX_QUERY_WORDS = 8
+
+# Longer words are not indexed, SearchTerm.term has the same limit
+MAX_WORD_LENGTH = 100
+
+# Whether FTS table exists, by database name
+_fts_tables = {}
+
+
+def tokenize(text):
+    """Returns lowercase words of the text without diacritics, the same way unicode61 tokenizer of FTS5 does"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [word for word in re.findall(r'\w+', text) if len(word) <= MAX_WORD_LENGTH]
+
+
+def terms(title, content):
+    """Returns weights of words of the post"""
+    weights = Counter(tokenize(content))
+    for word in tokenize(title):
+        weights[word] += TITLE_WEIGHT
+    return weights
+
+
+def query_words(query):
+    words = []
+    for word in tokenize(query):
+        if word not in words:
+            words.append(word)
+    return words[:MAX_QUERY_WORDS]
+
+
+def has_fts_table():
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[name]
+
+
+def available_backends():
+    """Returns names of indexes which can be used with current database, the best first"""
+    if connection.vendor == 'mysql':
+        return ['mysql', 'python']
+    if connection.vendor == 'sqlite' and has_fts_table():
+        return ['fts5', 'python']
+    return ['python']
+
+
+def backend():
+    """Returns name of index used for search: 'fts5', 'mysql' or 'python'"""
+    return getattr(settings, 'BLOG_SEARCH_BACKEND', None) or available_backends()[0]
+
+
+def index_posts(posts):
+    """Updates search index with current title and raw_content of given posts"""
+    kind = backend()
+    if kind == 'mysql':
+        # FULLTEXT index is maintained by MySQL itself
+        return
+
+    with transaction.atomic():
+        unindex_posts([post.pk for post in posts])
+        if kind == 'fts5':
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    'INSERT INTO %s (rowid, title, raw_content) VALUES (%%s, %%s, %%s)' % FTS_TABLE,
+                    [(post.pk, post.title, post.raw_content) for post in posts])
+        else:
+            SearchTerm.objects.bulk_create([
+                SearchTerm(term=term, post_id=post.pk, weight=weight)
+                for post in posts for term, weight in terms(post.title, post.raw_content).items()])
+
+
+def unindex_posts(pks):
+    """Removes posts with given ids from search index"""
+    kind = backend()
+    if not pks:
+        return
+    if kind == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, ', '.join(['%s'] * len(pks))), pks)
+    elif kind == 'python':
+        SearchTerm.objects.filter(post_id__in=pks).delete()
+
+
+def clear_index():
+    kind = backend()
+    if kind == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+    elif kind == 'python':
+        SearchTerm.objects.all().delete()
+
+
+def idf(total, frequency):
+    """Returns inverse document frequency of a word, like BM25 does"""
+    return log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+
+
+def search_posts(posts, query):
+    """
+    Returns given posts which contain all words of the query, the best matches first
+
+    :param posts: queryset of posts, e.g. only published ones
+    """
+    words = query_words(query)
+    if not words:
+        return posts.order_by('-pub_date').none()
+
+    kind = backend()
+    table = Post._meta.db_table
+    if kind == 'fts5':
+        # Words are quoted, so nothing in the query is taken as FTS5 syntax. Unary + keeps
+        # SQLite from looking up FTS table by rowid for every post, matches are looked up once.
+        return posts.extra(
+            tables=[FTS_TABLE],
+            where=['+%s.rowid = %s.id' % (FTS_TABLE, table), '%s MATCH %%s' % FTS_TABLE],
+            params=[' '.join('"%s"' % word for word in words)],
+            select={'rank': 'bm25(%s, %s, 1)' % (FTS_TABLE, TITLE_WEIGHT)},
+            order_by=['rank', '-pub_date'])
+
+    if kind == 'mysql':
+        match = 'MATCH (%s.title, %s.raw_content) AGAINST (%%s IN BOOLEAN MODE)' % (table, table)
+        query = ' '.join('+%s' % word for word in words)
+        return posts.extra(
+            where=[match], params=[query],
+            select={'rank': match}, select_params=[query],
+            order_by=['-rank', '-pub_date'])
+
+    frequencies = dict(SearchTerm.objects.filter(term__in=words).values_list('term').annotate(Count('pk')))
+    if len(frequencies) < len(words):
+        return posts.order_by('-pub_date').none()
+
+    total = Post.objects.count()
+    rank = Sum(Case(*[
+        When(search_terms__term=word, then=ExpressionWrapper(
+            F('search_terms__weight') * Value(idf(total, frequencies[word])), output_field=FloatField()))
+        for word in words], output_field=FloatField()))
+    return posts.filter(search_terms__term__in=words).annotate(
+        matched=Count('search_terms'), rank=rank).filter(matched=len(words)).order_by('-rank', '-pub_date')
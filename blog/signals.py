@@ -0,0 +1,168 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from taggit.models import Tag, TaggedItem
+
+from .cache import bump_version, invalidate_chrome
+from .fragments import refresh_fragments
+from .models import Post, Page, SocialLink, TaggedPost, TagCount, Category, HeaderImage
+from .purge import purge_post, purge_tags
+from .search import unindex_posts
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=TaggedItem)
+def posts_changed(sender, **kwargs):
+    bump_version('posts')
+    invalidate_chrome('tags')
+
+
+@receiver([post_save, post_delete], sender=Page)
+def pages_changed(sender, **kwargs):
+    bump_version('site')
+    invalidate_chrome('pages')
+
+
+@receiver([post_save, post_delete], sender=SocialLink)
+def social_links_changed(sender, **kwargs):
+    bump_version('site')
+    invalidate_chrome('social_links')
+
+
+@receiver(post_save, sender=Post)
+def sync_tag_index(sender, instance, **kwargs):
+    TaggedPost.sync([instance])
+
+
+# Fields of the post shown in its listing fragments
+FRAGMENT_FIELDS = ['title', 'slug', 'published', 'pub_date', 'read_time', 'image', 'category']
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = Post.objects.filter(pk=instance.pk).only(*FRAGMENT_FIELDS).first()
+
+
+@receiver(post_save, sender=Post)
+def refresh_saved_post_fragments(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    attnames = [Post._meta.get_field(name).attname for name in FRAGMENT_FIELDS]
+    if previous is None or any(getattr(previous, name) != getattr(instance, name) for name in attnames):
+        refresh_fragments([instance])
+
+
+@receiver(post_save, sender=Post)
+def post_slug_changed(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous is None or previous.slug != instance.slug:
+        bump_version('slugs')
+
+
+@receiver(post_delete, sender=Post)
+@receiver([post_save, post_delete], sender=Tag)
+def slugs_changed(sender, **kwargs):
+    bump_version('slugs')
+
+
+@receiver(post_save, sender=Post)
+def purge_saved_post(sender, instance, **kwargs):
+    purge_post(instance, getattr(instance, '_previous', None))
+
+
+@receiver(post_delete, sender=Post)
+def purge_deleted_post(sender, instance, **kwargs):
+    purge_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    unindex_posts([instance.pk])
+
+
+def is_post_tagging(tagged_item):
+    return tagged_item.content_type_id == ContentType.objects.get_for_model(Post).pk
+
+
+@receiver(post_save, sender=TaggedItem)
+def index_tagged_post(sender, instance, **kwargs):
+    if not is_post_tagging(instance):
+        return
+
+    post = Post.objects.filter(pk=instance.object_id).only('published', 'pub_date').first()
+    if post is not None:
+        entry, created = TaggedPost.objects.get_or_create(
+            tag_id=instance.tag_id, post_id=post.pk,
+            defaults={'published': post.published, 'pub_date': post.pub_date})
+        if created and entry.published:
+            TagCount.adjust([entry.tag_id], 1)
+
+
+@receiver(post_delete, sender=TaggedItem)
+def unindex_tagged_post(sender, instance, **kwargs):
+    if is_post_tagging(instance):
+        TaggedPost.objects.filter(tag_id=instance.tag_id, post_id=instance.object_id).delete()
+
+
+@receiver(post_delete, sender=TaggedPost)
+def uncount_tagged_post(sender, instance, **kwargs):
+    if instance.published:
+        TagCount.adjust([instance.tag_id], -1)
+
+
+@receiver([post_save, post_delete], sender=TaggedItem)
+def refresh_tagging_fragments(sender, instance, **kwargs):
+    # Tags can be changed outside of PostAdmin.save_related too, e.g. with post.tags.add()
+    if is_post_tagging(instance):
+        refresh_fragments(Post.objects.filter(pk=instance.object_id).select_related(
+            'image', 'category').prefetch_related('tags'))
+
+
+@receiver([post_save, post_delete], sender=TaggedItem)
+def purge_tagging(sender, instance, **kwargs):
+    if not is_post_tagging(instance):
+        return
+
+    # Tag listings show all tags of each post, so every tag of the post is affected
+    tag_slugs = list(TaggedItem.objects.filter(
+        content_type_id=instance.content_type_id,
+        object_id=instance.object_id).values_list('tag__slug', flat=True))
+    tag_slugs += Tag.objects.filter(pk=instance.tag_id).values_list('slug', flat=True)
+    purge_tags(tag_slugs)
+
+
+@receiver(post_delete, sender=Tag)
+def purge_deleted_tag(sender, instance, **kwargs):
+    purge_tags([instance.slug])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=HeaderImage)
+def refresh_post_fragments(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    field = 'category' if sender is Category else 'image'
+    posts = list(Post.objects.filter(**{field: instance}).select_related('image', 'category').prefetch_related('tags'))
+    if not posts:
+        return
+    refresh_fragments(posts)
+    # Posts can be anywhere in listings, so all cached responses are dropped
+    bump_version('posts')
+    bump_version('site')
+
+
+@receiver(post_save, sender=Tag)
+def refresh_tagged_post_fragments(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    posts = list(Post.objects.filter(tag_index__tag=instance).select_related(
+        'image', 'category').prefetch_related('tags'))
+    if not posts:
+        return
+    refresh_fragments(posts)
+    # Renamed tag is shown on listings of every other tag of these posts, so all cached responses are dropped
+    bump_version('posts')
+    bump_version('site')
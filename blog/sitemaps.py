@@ -0,0 +1,163 @@
+import hashlib
+from math import ceil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
+
+from .cache import get_version
+from .models import Post, Page, TaggedPost
+
+# Rows written to the response at once
+CHUNK_SIZE = 500
+
+
+def posts_section():
+    """Returns queryset of (slug, lastmod) rows, ordered so it can be split into files"""
+    return Post.objects.filter(published=True).order_by('pk').values_list('slug', 'pub_date')
+
+
+def pages_section():
+    return Page.objects.order_by('pk').values_list('slug')
+
+
+def tags_section():
+    return TaggedPost.objects.filter(published=True).values_list('tag__slug').annotate(
+        lastmod=Max('pub_date')).order_by('tag__slug')
+
+
+# Section name: (function returning rows, function turning row into (path, lastmod), versions it's cached with)
+# Tags are renamed without saving any post, so their section depends on version of slugs too
+SECTIONS = {
+    'posts': (posts_section, lambda row: (reverse('post', args=[row[0]]), row[1]), ['posts']),
+    'pages': (pages_section, lambda row: (reverse('page', args=[row[0]]), None), ['site']),
+    'tags': (tags_section, lambda row: (reverse('tag', args=[row[0]]), row[1]), ['posts', 'slugs']),
+}
+
+
+def limit():
+    """Returns maximum number of URLs in a single sitemap file, 50 000 by the protocol"""
+    return getattr(settings, 'BLOG_SITEMAP_LIMIT', 50000)
+
+
+def w3c_date(date):
+    return timezone.localtime(date).replace(microsecond=0).isoformat()
+
+
+def url_entry(request, path, lastmod):
+    lastmod = '<lastmod>%s</lastmod>' % w3c_date(lastmod) if lastmod is not None else ''
+    return '<url><loc>%s</loc>%s</url>\n' % (escape(request.build_absolute_uri(path)), lastmod)
+
+
+def section_urls(request, name, page=None):
+    """Yields entries of the section streamed from the database, only n-th file of it if page is given"""
+    queryset, to_url, versions = SECTIONS[name]
+    if name == 'pages' and page in (None, 1):
+        yield from home_url(request)
+
+    rows = queryset()
+    if page is not None:
+        rows = rows[(page - 1) * limit():page * limit()]
+    for row in rows.iterator():
+        yield url_entry(request, *to_url(row))
+
+
+def section_count(name):
+    """Returns number of URLs in the section, home page is the first one of pages"""
+    queryset, to_url, versions = SECTIONS[name]
+    return queryset().count() + (1 if name == 'pages' else 0)
+
+
+def home_url(request):
+    latest = Post.objects.filter(published=True).aggregate(latest=Max('pub_date'))['latest']
+    yield url_entry(request, reverse('index'), latest)
+
+
+def urlset(entries):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for entry in entries:
+        yield entry
+    yield '</urlset>\n'
+
+
+def sitemap_index(request, counts):
+    latest = Post.objects.filter(published=True).aggregate(latest=Max('pub_date'))['latest']
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for name in sorted(SECTIONS):
+        for page in range(1, int(ceil(counts[name] / limit())) + 1):
+            path = reverse('sitemap_section', args=[name, page])
+            lastmod = '<lastmod>%s</lastmod>' % w3c_date(latest) if latest is not None else ''
+            yield '<sitemap><loc>%s</loc>%s</sitemap>\n' % (escape(request.build_absolute_uri(path)), lastmod)
+    yield '</sitemapindex>\n'
+
+
+def chunked(parts):
+    """Joins small pieces of XML, so the response isn't written row by row"""
+    buffer = []
+    for part in parts:
+        buffer.append(part)
+        if len(buffer) >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def cached_response(key, make_parts):
+    """
+    Returns cached sitemap, or streams new one and caches it once it's complete
+
+    :param make_parts: function returning generator of XML pieces
+    """
+    content = cache.get(key)
+    if content is not None:
+        return HttpResponse(content, content_type='application/xml')
+
+    def stream():
+        parts = []
+        for part in chunked(make_parts()):
+            parts.append(part)
+            yield part
+        cache.set(key, ''.join(parts), getattr(settings, 'BLOG_SITEMAP_CACHE_TIMEOUT', 86400))
+
+    return StreamingHttpResponse(stream(), content_type='application/xml')
+
+
+def sitemap_key(request, name, versions):
+    # Locations are absolute, so the same sitemap is different for every host
+    host = hashlib.md5(request.build_absolute_uri('/').encode('utf-8')).hexdigest()
+    return 'blog:sitemap:%s:%s:%s:%s' % (name, limit(), host, ':'.join(str(version) for version in versions))
+
+
+def index(request):
+    """Displays sitemap of the whole blog, or index of sitemap files when there is too much URLs for one"""
+    def urls():
+        for name in sorted(SECTIONS):
+            yield from section_urls(request, name)
+
+    def parts():
+        counts = dict((name, section_count(name)) for name in SECTIONS)
+        if sum(counts.values()) <= limit():
+            return urlset(urls())
+        return sitemap_index(request, counts)
+
+    key = sitemap_key(request, 'index', [get_version('posts'), get_version('site'), get_version('slugs')])
+    return cached_response(key, parts)
+
+
+def section(request, name, page):
+    """Displays n-th sitemap file of section when whole sitemap doesn't fit in one"""
+    page = int(page)
+    queryset, to_url, versions = SECTIONS[name]
+    if page < 1:
+        raise Http404('No such sitemap file')
+
+    key = sitemap_key(request, '%s:%s' % (name, page), [get_version(version) for version in versions])
+    if key not in cache and section_count(name) <= (page - 1) * limit():
+        raise Http404('No such sitemap file')
+
+    return cached_response(key, lambda: urlset(section_urls(request, name, page)))
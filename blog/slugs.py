@@ -0,0 +1,95 @@
+"""
+Bloom filters of existing post and tag slugs
+
+Bots probe URLs with made up slugs. Views guarded with known_slug answer them
+with 404 before any query, including the one of conditional GET. Filters are
+kept in memory of each process and built again when version of slugs in the
+shared cache changes (see signals.py), or when they get older than
+BLOG_SLUG_FILTER_TIMEOUT.
+"""
+import hashlib
+import inspect
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404
+from taggit.models import Tag
+
+from .cache import get_version
+from .models import Post
+
+# Share of unknown slugs let through to the database
+ERROR_RATE = 0.001
+
+# Name: function returning all existing slugs
+SOURCES = {
+    'post': lambda: Post.objects.values_list('slug', flat=True),
+    'tag': lambda: Tag.objects.values_list('slug', flat=True),
+}
+
+# Name: (version of slugs, time of building, filter)
+_filters = {}
+
+
+class BloomFilter(object):
+    """Set of strings which may contain strings never added (at given rate), but never misses added ones"""
+
+    def __init__(self, items, error_rate=ERROR_RATE):
+        items = list(items)
+        count = max(1, len(items))
+        self.size = max(64, int(math.ceil(-count * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / count * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        for item in items:
+            for position in self.positions(item):
+                self.bits[position >> 3] |= 1 << (position & 7)
+
+    def positions(self, item):
+        # Double hashing, two halves of one digest give all positions
+        digest = hashlib.md5(item.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + n * second) % self.size for n in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+def get_filter(name):
+    version = get_version('slugs')
+    timeout = getattr(settings, 'BLOG_SLUG_FILTER_TIMEOUT', 300)
+    cached = _filters.get(name)
+    if cached is None or cached[0] != version or time.time() - cached[1] > timeout:
+        cached = _filters[name] = (version, time.time(), BloomFilter(SOURCES[name]()))
+    return cached[2]
+
+
+def forget():
+    """Drops filters of this process"""
+    _filters.clear()
+
+
+def require(name, slug):
+    """Raises Http404 if there surely is no post or tag with given slug"""
+    if slug not in get_filter(name):
+        raise Http404('No %s with slug %s' % (name, slug))
+
+
+def known_slug(name, argument):
+    """
+    Answers requests for unknown slugs with 404, put it above other decorators of the view
+
+    :param name: 'post' or 'tag'
+    :param argument: name of view argument with the slug
+    """
+    def decorator(view):
+        signature = inspect.signature(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            require(name, signature.bind(request, *args, **kwargs).arguments[argument])
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,15 +1,32 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
 import xml.etree.ElementTree
+from io import StringIO
+from unittest import mock
 
+from django.contrib import admin
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.text import slugify
 from mistune import Markdown
 from taggit.models import Tag
 
-from .markdown import PostRenderer, PostInlineLexer
-from .models import Post, HeaderImage, Page
+from . import slugs
+from .admin import PostAdmin
+from .markdown import PostRenderer, PostInlineLexer, get_markdown, render_markdown
+from .models import Post, HeaderImage, Page, Category, TaggedPost, TagCount, make_excerpt
 
 example_image = SimpleUploadedFile(name='test.png', content=open(
     'test.png', 'rb').read(), content_type='image/jpeg')
@@ -36,7 +53,7 @@ def add_post(title, published, content, fullwidth=True, tags=None):
 
     post = Post.objects.create(
         title=title,
-        slug=title.replace(' ', '-')[0],
+        slug=slugify(title),
         title_size=42,
         title_background='rgba(0, 0, 0, 0.5)',
         image=headerImage,
@@ -52,8 +69,30 @@ def add_post(title, published, content, fullwidth=True, tags=None):
     return post
 
 
-class IndexViewTests(TestCase):
+# Tests clear the cache, so they get their own instead of the one of the site
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='blog-test-cache-'),
+    }
+}
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_CACHES['default']['LOCATION'], ignore_errors=True)
+
+
+@override_settings(BLOG_PAGE_CACHE_TIMEOUT=0, BLOG_IMAGE_WORKERS=0, CACHES=TEST_CACHES)
+class BlogTestCase(TestCase):
+    def setUp(self):
+        # Cached listings and versions would leak between tests otherwise
+        cache.clear()
+        slugs.forget()
+
+
+class IndexViewTests(BlogTestCase):
     def setUp(self):
+        super().setUp()
         from . import views
         views.POSTS_PER_PAGE = 5
 
@@ -99,8 +138,9 @@ class IndexViewTests(TestCase):
             ['<Post: Awesome post>', '<Post: Bad post>', '<Post: Nice post>', '<Post: Good post>'])
 
 
-class PaginationSpecificTests(TestCase):
+class PaginationSpecificTests(BlogTestCase):
     def setUp(self):
+        super().setUp()
         from . import views
         views.POSTS_PER_PAGE = 2
 
@@ -148,11 +188,150 @@ class PaginationSpecificTests(TestCase):
         )
 
 
-class PostViewTests(TestCase):
+class KeysetPaginationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        from . import views
+        views.POSTS_PER_PAGE = 3
+        views.KEYSET_PAGINATION = True
+
+    def tearDown(self):
+        from . import views
+        views.POSTS_PER_PAGE = 5
+        views.KEYSET_PAGINATION = True
+
+    def test_same_pages_as_offset_pagination(self):
+        """Keyset pages should contain the same posts as Paginator ones"""
+        from . import views
+
+        for n in range(1, 11):
+            add_post('Post ' + str(n), n != 5, 'This is test content!')
+
+        for number in range(0, 6):
+            views.KEYSET_PAGINATION = True
+            keyset = self.client.get(reverse('index_pagination', args=[number])).context['posts']
+            views.KEYSET_PAGINATION = False
+            offset = self.client.get(reverse('index_pagination', args=[number])).context['posts']
+
+            self.assertEqual(list(keyset), list(offset))
+            self.assertEqual(keyset.number, offset.number)
+            self.assertEqual(keyset.has_next(), offset.has_next())
+            self.assertEqual(keyset.has_previous(), offset.has_previous())
+
+    def test_deep_page_without_count_and_offset(self):
+        """Once page-boundary index is cached, deep page is a single query without COUNT and OFFSET"""
+        for n in range(1, 31):
+            add_post('Post ' + str(n), True, 'This is test content!')
+
+        self.client.get(reverse('index_pagination', args=[1]))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index_pagination', args=[9]))
+
+        self.assertQuerysetEqual(
+            response.context['posts'],
+            ['<Post: Post 6>', '<Post: Post 5>', '<Post: Post 4>']
+        )
+        # MAX(pub_date) validator for conditional GET is not a part of pagination
+        post_queries = [q['sql'] for q in queries if 'blog_post' in q['sql'] and 'MAX(' not in q['sql']]
+        self.assertEqual(len(post_queries), 1)
+        self.assertNotIn('COUNT', post_queries[0])
+        self.assertNotIn('OFFSET', post_queries[0])
+
+    def test_index_refreshed_after_new_post(self):
+        """New post should invalidate cached page-boundary index"""
+        for n in range(1, 4):
+            add_post('Post ' + str(n), True, 'This is test content!')
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.context['posts'].has_next())
+
+        add_post('Post 4', True, 'This is test content!')
+        response = self.client.get(reverse('index_pagination', args=[2]))
+        self.assertQuerysetEqual(response.context['posts'], ['<Post: Post 1>'])
+
+
+class IndexUsageTests(BlogTestCase):
+    def explain(self, queryset):
+        """Returns names of indexes used by the database to run the query"""
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                return ' '.join(row[-1] for row in cursor.fetchall())
+            elif connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql, params)
+                columns = [column[0] for column in cursor.description]
+                return ' '.join(str(row[columns.index('key')]) for row in cursor.fetchall())
+            self.skipTest('EXPLAIN is checked only on SQLite and MySQL')
+
+    def test_listing_uses_published_pub_date_index(self):
+        for n in range(1, 4):
+            add_post('Post ' + str(n), n % 2 == 0, 'This is test content!')
+
+        plan = self.explain(Post.objects.filter(published=True).order_by('-pub_date', '-pk')[:6])
+        self.assertIn('blog_post_published_pub_idx', plan)
+
+    def test_post_lookup_uses_slug_index(self):
+        add_post('Good post', True, 'This is a new content!')
+
+        plan = self.explain(Post.objects.filter(published=True, slug='good-post'))
+        self.assertRegex(plan, 'sqlite_autoindex_blog_post|slug')
+
+
+class ListingQueriesTests(BlogTestCase):
+    """Number of queries of listings should not depend on number of shown posts"""
+
+    def setUp(self):
+        super().setUp()
+        test_tag = Tag.objects.create(name="Test", slug="test")
+        other_tag = Tag.objects.create(name="Other", slug="other")
+        category = Category.objects.create(name="Python", image=example_image)
+        for n in range(1, 13):
+            post = add_post('Post ' + str(n), True, 'This is test content!', tags=[test_tag, other_tag])
+            post.category = category
+            post.save()
+
+    def tearDown(self):
+        from . import views
+        views.POSTS_PER_PAGE = 5
+
+    def assertQueriesPerPage(self, number, path):
+        from . import views
+
+        for per_page in [2, 6]:
+            views.POSTS_PER_PAGE = per_page
+            # Warm up cached chrome and page-boundary index
+            self.client.get(path)
+            with self.assertNumQueries(number):
+                response = self.client.get(path)
+            self.assertEqual(len(response.context['posts']), per_page)
+
+    def test_index(self):
+        # Validator for conditional GET and the page itself
+        self.assertQueriesPerPage(2, reverse('index'))
+        self.assertQueriesPerPage(2, reverse('index_pagination', args=[2]))
+
+    def test_tag(self):
+        # Validator for conditional GET, the page and the tag itself, tags of posts are in widget fragments
+        self.assertQueriesPerPage(3, reverse('tag', args=['test']))
+        self.assertQueriesPerPage(3, reverse('tag_pagination', args=['test', 2]))
+
+    def test_tag_without_fragments(self):
+        # Tags of posts are loaded additionally to render widgets from template
+        Post.objects.update(widget_html='')
+        self.assertQueriesPerPage(4, reverse('tag', args=['test']))
+        self.assertQueriesPerPage(4, reverse('tag_pagination', args=['test', 2]))
+
+    def test_index_logged_in(self):
+        self.client.force_login(get_test_user_tom())
+        # Session and user are loaded additionally
+        self.assertQueriesPerPage(4, reverse('index'))
+
+
+class PostViewTests(BlogTestCase):
     def test_published_post(self):
         post = add_post('good post', True, 'This is a public post')
 
-        response = self.client.get(reverse('post', args=post.slug))
+        response = self.client.get(reverse('post', args=[post.slug]))
         self.assertEqual(response.status_code, 200)
         self.assertQuerysetEqual([response.context['post']], ['<Post: good post>'])
         self.assertTemplateUsed(response, "blog/post.html")
@@ -164,7 +343,7 @@ class PostViewTests(TestCase):
         """
         post = add_post('bad post', False, 'This is a private post')
 
-        response = self.client.get(reverse('post', args=post.slug))
+        response = self.client.get(reverse('post', args=[post.slug]))
         self.assertEqual(response.status_code, 404)
 
     def test_private_post_when_logged_in(self):
@@ -174,11 +353,11 @@ class PostViewTests(TestCase):
         self.client.force_login(get_test_user_tom())
         post = add_post('bad post', False, 'This is a private post')
 
-        response = self.client.get(reverse('post', args=post.slug))
+        response = self.client.get(reverse('post', args=[post.slug]))
         self.assertEqual(response.status_code, 200)
 
 
-class PageTests(TestCase):
+class PageTests(BlogTestCase):
     def test_page_ok(self):
         """Check if page renders correctly"""
         page = Page.objects.create(title="Test page", slug="test-page", content="It better works, "
@@ -188,15 +367,222 @@ class PageTests(TestCase):
         self.assertTemplateUsed(response, 'blog/page.html')
         self.assertEqual(response.context['page'], page)
 
+    def test_unknown_page(self):
+        Page.objects.create(title="Test page", slug="test-page", content="Content")
+        self.client.get(reverse('page', args=['test-page']))
+
+        with self.assertNumQueries(0):
+            for slug in ['random', 'wp-admin', 'random']:
+                response = self.client.get(reverse('page', args=[slug]))
+                self.assertEqual(response.status_code, 404)
+
+    def test_cached_page_invalidated(self):
+        page = Page.objects.create(title="Test page", slug="test-page", content="Old content")
+        self.assertContains(self.client.get(reverse('page', args=[page.slug])), 'Old content')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('page', args=[page.slug]))
+
+        page.content = 'New content'
+        page.save()
+        self.assertContains(self.client.get(reverse('page', args=[page.slug])), 'New content')
+
+        page.delete()
+        self.assertEqual(self.client.get(reverse('page', args=[page.slug])).status_code, 404)
+
+
+class ChromeCacheTests(BlogTestCase):
+    def test_warm_request_without_chrome_queries(self):
+        """Pages, social links and tags should be taken from cache on warm request"""
+        from .cache import chrome_stats
+
+        Page.objects.create(title="Test page", slug="test-page", content="Content")
+        self.client.get(reverse('index'))
+
+        hits = chrome_stats['hits']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+
+        self.assertEqual(chrome_stats['hits'], hits + 3)
+        for query in queries:
+            self.assertNotIn('blog_page', query['sql'])
+            self.assertNotIn('blog_sociallink', query['sql'])
+            self.assertNotIn('taggit_tag', query['sql'])
+
+    def test_invalidated_on_page_save(self):
+        """Saving a page should be visible in navigation right away"""
+        self.client.get(reverse('index'))
+
+        Page.objects.create(title="Test page", slug="test-page", content="Content")
+        response = self.client.get(reverse('index'))
+        self.assertEqual([page.slug for page in response.context['pages']], ['test-page'])
+
+    def test_invalidated_on_tagging(self):
+        """Tagging a post should be visible in tag cloud right away"""
+        post = add_post('Good post', True, 'This is a new content!')
+        self.client.get(reverse('index'))
+
+        post.tags.add(Tag.objects.create(name="Test", slug="test"))
+        response = self.client.get(reverse('index'))
+        self.assertEqual([tag.slug for tag in response.context['tags']], ['test'])
+
+
+@override_settings(BLOG_PAGE_CACHE_TIMEOUT=600)
+class ResponseCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        from . import views
+        views.POSTS_PER_PAGE = 2
+
+    def tearDown(self):
+        from . import views
+        views.POSTS_PER_PAGE = 5
+
+    def assertCached(self, path):
+        """Only validators for conditional GET should be queried"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all('MAX(' in query['sql'] for query in queries), path)
+
+    def assertNotCached(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(all('MAX(' in query['sql'] for query in queries), path)
+
+    def test_anonymous_served_from_cache(self):
+        post = add_post('Good post', True, 'This is a new content!')
+        for path in [reverse('index'), reverse('post', args=[post.slug])]:
+            self.client.get(path)
+            self.assertCached(path)
+
+    def test_logged_in_bypass_cache(self):
+        """Authors should always see fresh pages with unpublished posts"""
+        self.client.get(reverse('index'))
+        self.client.force_login(get_test_user_tom())
+        add_post('Bad post', False, 'This is a private post')
+
+        response = self.client.get(reverse('index'))
+        self.assertQuerysetEqual(response.context['posts'], ['<Post: Bad post>'])
+
+    def test_post_save_purges_only_affected_pages(self):
+        """Editing a post should not flush pages on which it is not shown"""
+        test_tag = Tag.objects.create(name="Test", slug="test")
+        other_tag = Tag.objects.create(name="Other", slug="other")
+        for n in range(1, 5):
+            add_post('Post ' + str(n), True, 'This is test content!', tags=[test_tag])
+        first = add_post('Zero post', True, 'This is test content!', tags=[other_tag])
+        first.pub_date = timezone.now() - timezone.timedelta(days=1)
+        first.save()
+
+        paths = [reverse('index'), reverse('index_pagination', args=[2]), reverse('index_pagination', args=[3]),
+                 reverse('tag', args=['test']), reverse('tag', args=['other']), reverse('post', args=[first.slug])]
+        for path in paths:
+            self.client.get(path)
+
+        first.title = 'Zero post edited'
+        first.save()
 
-class UtilityTests(TestCase):
+        self.assertCached(reverse('index'))
+        self.assertCached(reverse('index_pagination', args=[2]))
+        self.assertCached(reverse('tag', args=['test']))
+        self.assertNotCached(reverse('index_pagination', args=[3]))
+        self.assertNotCached(reverse('tag', args=['other']))
+        self.assertNotCached(reverse('post', args=[first.slug]))
+
+    def test_publish_purges_listings(self):
+        """Publishing from admin should show post on index right away"""
+        from .admin import publish
+
+        add_post('Good post', True, 'This is a new content!')
+        post = add_post('Nice post', False, 'This is a new content!')
+        self.client.get(reverse('index'))
+
+        publish(None, None, Post.objects.filter(pk=post.pk))
+        response = self.client.get(reverse('index'))
+        self.assertQuerysetEqual(response.context['posts'], ['<Post: Nice post>', '<Post: Good post>'])
+
+    def test_purged_again_after_commit(self):
+        """Request served before the edit is committed would cache old page until timeout"""
+        post = add_post('Good post', True, 'This is a new content!')
+        path = reverse('post', args=[post.slug])
+
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            post.title = 'Edited post'
+            post.save()
+            self.client.get(path)
+        self.assertCached(path)
+        for callback in callbacks:
+            callback()
+        self.assertNotCached(path)
+
+    def test_process_local_cache_warning(self):
+        """Other workers would keep serving purged pages from their own memory"""
+        from .cache import check_shared_cache
+
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['blog.W001'])
+
+
+class ConditionalGetTests(BlogTestCase):
+    def assertNotModified(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        return response
+
+    def test_not_modified(self):
+        test_tag = Tag.objects.create(name="Test", slug="test")
+        post = add_post('Good post', True, 'This is a new content!', tags=[test_tag])
+
+        for path in [reverse('index'), reverse('index_pagination', args=[1]), reverse('post', args=[post.slug]),
+                     reverse('tag', args=['test']), reverse('rss_index'), reverse('rss_tag', args=['test'])]:
+            self.assertNotModified(path)
+
+    def test_modified_after_edit(self):
+        """Editing a post without changing pub_date should change validators"""
+        post = add_post('Good post', True, 'This is a new content!')
+        response = self.assertNotModified(reverse('rss_index'))
+
+        post.content = 'Even better content'
+        post.save()
+        response = self.client.get(reverse('rss_index'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Even better content', response.content)
+
+    def test_validators_differ_for_authors(self):
+        """Authors see unpublished posts, so they can't share validators with readers"""
+        add_post('Good post', True, 'This is a new content!')
+        etag = self.client.get(reverse('index'))['ETag']
+
+        self.client.force_login(get_test_user_tom())
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_versions_shared_between_processes(self):
+        """Readers spread across workers should get 304 from every one of them, also after restart"""
+        from .cache import get_version
+
+        versions = '%d %d' % (get_version('posts'), get_version('site'))
+        other = subprocess.check_output([sys.executable, 'manage.py', 'shell', '-c', (
+            'from django.test import override_settings\n'
+            'from blog.cache import get_version\n'
+            'with override_settings(CACHES=%r):\n'
+            '    print(get_version("posts"), get_version("site"))' % TEST_CACHES)])
+        self.assertEqual(other.decode().strip(), versions)
+
+
+class UtilityTests(BlogTestCase):
     def test_youtube_redirection_ok(self):
         response = self.client.get('/youtube')
         self.assertRedirects(response, 'https://www.youtube.com/channel/UCHPUGfK2zW0VUNN2SgCHsXg', fetch_redirect_response=False)
 
 
-class TagTests(TestCase):
+class TagTests(BlogTestCase):
     def setUp(self):
+        super().setUp()
         from . import views
         views.POSTS_PER_PAGE = 5
 
@@ -249,7 +635,112 @@ class TagTests(TestCase):
              '<Post: Good post>'])
 
 
-class RSSTests(TestCase):
+class TagIndexTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test_tag = Tag.objects.create(name="Test", slug="test")
+
+    def indexed(self):
+        return list(TaggedPost.objects.filter(tag=self.test_tag).values_list('post__title', 'published'))
+
+    def test_follows_tagging(self):
+        post = add_post('Good post', True, 'This is a new content!', tags=[self.test_tag])
+        self.assertEqual(self.indexed(), [('Good post', True)])
+
+        post.tags.remove(self.test_tag)
+        self.assertEqual(self.indexed(), [])
+
+    def test_follows_publishing(self):
+        from .admin import publish, unpublish
+
+        post = add_post('Good post', False, 'This is a new content!', tags=[self.test_tag])
+        publish(None, None, Post.objects.filter(pk=post.pk))
+        self.assertEqual(self.indexed(), [('Good post', True)])
+
+        unpublish(None, None, Post.objects.filter(pk=post.pk))
+        self.assertEqual(self.indexed(), [('Good post', False)])
+
+        post.published = True
+        post.pub_date = timezone.now()
+        post.save()
+        entry = TaggedPost.objects.get(tag=self.test_tag)
+        self.assertEqual((entry.published, entry.pub_date), (True, post.pub_date))
+
+    def test_removed_with_post(self):
+        post = add_post('Good post', True, 'This is a new content!', tags=[self.test_tag])
+        post.delete()
+        self.assertEqual(self.indexed(), [])
+
+    def test_offset_pagination(self):
+        """Tag listing should read the index also without keyset pagination"""
+        from . import views
+        views.KEYSET_PAGINATION = False
+        try:
+            add_post('Good post', True, 'This is a new content!', tags=[self.test_tag])
+            add_post('Nice post', True, 'This is a new content!', tags=[self.test_tag])
+            response = self.client.get(reverse('tag', args=['test']))
+        finally:
+            views.KEYSET_PAGINATION = True
+        self.assertQuerysetEqual(response.context['posts'], ['<Post: Nice post>', '<Post: Good post>'])
+
+
+class TagCountTests(BlogTestCase):
+    def counts(self):
+        return [(tag.slug, tag.num_times) for tag in TagCount.most_common(5)]
+
+    def test_counts_only_published(self):
+        python = Tag.objects.create(name="Python", slug="python")
+        django = Tag.objects.create(name="Django", slug="django")
+        add_post('Good post', True, 'This is a new content!', tags=[python, django])
+        add_post('Nice post', True, 'This is a new content!', tags=[python])
+        add_post('Bad post', False, 'This is a new content!', tags=[python, django])
+
+        self.assertEqual(self.counts(), [('python', 2), ('django', 1)])
+
+    def test_follows_changes(self):
+        from .admin import publish, unpublish
+
+        python = Tag.objects.create(name="Python", slug="python")
+        post = add_post('Good post', False, 'This is a new content!', tags=[python])
+        self.assertEqual(self.counts(), [])
+
+        publish(None, None, Post.objects.filter(pk=post.pk))
+        self.assertEqual(self.counts(), [('python', 1)])
+        publish(None, None, Post.objects.filter(pk=post.pk))
+        self.assertEqual(self.counts(), [('python', 1)])
+
+        post.tags.add('Django')
+        self.assertCountEqual(self.counts(), [('python', 1), ('django', 1)])
+        post.tags.remove('Python')
+        self.assertEqual(self.counts(), [('django', 1)])
+
+        unpublish(None, None, Post.objects.filter(pk=post.pk))
+        self.assertEqual(self.counts(), [])
+        publish(None, None, Post.objects.filter(pk=post.pk))
+        Post.objects.get(pk=post.pk).delete()
+        self.assertEqual(self.counts(), [])
+
+    def test_delete_tag(self):
+        """Counts of a deleted tag should go away with it, deferred foreign keys would fail on commit otherwise"""
+        python = Tag.objects.create(name="Python", slug="python")
+        add_post('Good post', True, 'This is a new content!', tags=[python, 'Django'])
+
+        python.delete()
+        connection.check_constraints(table_names=['blog_tagcount', 'blog_taggedpost'])
+        self.assertEqual(self.counts(), [('django', 1)])
+        self.assertFalse(TagCount.objects.filter(tag_id=python.pk).exists())
+
+    def test_tag_cloud_without_tagged_items(self):
+        add_post('Good post', True, 'This is a new content!', tags=['Python'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertEqual([tag.name for tag in response.context['tags']], ['Python'])
+        for query in queries:
+            self.assertNotIn('taggit_taggeditem', query['sql'])
+
+
+class RSSTests(BlogTestCase):
     def test_no_private_posts(self):
         """Unpublished posts should not be present in XML."""
         add_post('Good post', True, 'This is a new content!')
@@ -287,6 +778,670 @@ class RSSTests(TestCase):
         self.assertNotIn('Bad post', titles)
 
 
+def feed_items(response):
+    root = xml.etree.ElementTree.fromstring(response.content)
+    return [{tag.tag: tag.text.strip() for tag in child} for child in root[0] if child.tag == 'item']
+
+
+class BoundedFeedTests(BlogTestCase):
+    @override_settings(BLOG_FEED_ITEMS=3)
+    def test_items_limit(self):
+        for n in range(1, 6):
+            add_post('Post ' + str(n), True, 'This is test content!')
+
+        items = feed_items(self.client.get(reverse('rss_index')))
+        self.assertEqual([item['title'] for item in items], ['Post 5', 'Post 4', 'Post 3'])
+
+    def test_raw_content_not_loaded(self):
+        add_post('Good post', True, 'This is a new content!')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('rss_index'))
+        for query in queries:
+            self.assertNotIn('raw_content', query['sql'])
+
+    @override_settings(BLOG_FEED_SUMMARY=True)
+    def test_summary_only(self):
+        post = add_post('Good post', True, '')
+        post.content = '<p>' + 'Lorem ipsum &amp; dolor. ' * 40 + '</p>'
+        post.excerpt = make_excerpt(post.content)
+        post.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            items = feed_items(self.client.get(reverse('rss_index')))
+        self.assertEqual(items[0]['description'], post.excerpt)
+        self.assertTrue(items[0]['description'].startswith('Lorem ipsum & dolor.'))
+        self.assertEqual(len(items[0]['description'].split()), 50)
+        for query in queries:
+            self.assertNotIn('"content"', query['sql'])
+
+    def test_excerpt_not_in_admin_form(self):
+        """Excerpt is made from content on save, so whatever author typed would be lost"""
+        from django.forms import modelform_factory
+
+        self.assertNotIn('excerpt', modelform_factory(Post, fields='__all__').base_fields)
+
+
+def sitemap_locs(response):
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    root = xml.etree.ElementTree.fromstring(content)
+    return root.tag.split('}')[1], [child[0].text for child in root]
+
+
+class SitemapTests(BlogTestCase):
+    def test_urlset(self):
+        add_post('Good post', True, 'This is test content!', tags=['Python'])
+        add_post('Bad post', False, 'This is test content!', tags=['Secret'])
+        Page.objects.create(title='About', slug='about', content='About me')
+
+        kind, locs = sitemap_locs(self.client.get(reverse('sitemap')))
+        self.assertEqual(kind, 'urlset')
+        self.assertEqual(locs, ['http://testserver/', 'http://testserver/page/about/',
+                                'http://testserver/post/good-post/', 'http://testserver/tag/python/'])
+
+    @override_settings(BLOG_SITEMAP_LIMIT=2)
+    def test_index(self):
+        for n in range(1, 4):
+            add_post('Post ' + str(n), True, 'This is test content!')
+
+        kind, locs = sitemap_locs(self.client.get(reverse('sitemap')))
+        self.assertEqual(kind, 'sitemapindex')
+        self.assertEqual(locs, ['http://testserver/sitemap-pages-1.xml', 'http://testserver/sitemap-posts-1.xml',
+                                'http://testserver/sitemap-posts-2.xml'])
+
+        kind, locs = sitemap_locs(self.client.get(reverse('sitemap_section', args=['posts', 2])))
+        self.assertEqual(locs, ['http://testserver/post/post-3/'])
+        response = self.client.get(reverse('sitemap_section', args=['posts', 3]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached(self):
+        add_post('Good post', True, 'This is test content!')
+        response = self.client.get(reverse('sitemap'))
+        self.assertTrue(response.streaming)
+        # Sitemap is cached once it's streamed completely
+        b''.join(response.streaming_content)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('sitemap'))
+        self.assertFalse(response.streaming)
+
+        post = add_post('New post', True, 'This is test content!')
+        post.save()
+        kind, locs = sitemap_locs(self.client.get(reverse('sitemap')))
+        self.assertIn('http://testserver/post/new-post/', locs)
+
+    @override_settings(BLOG_SITEMAP_CACHE_TIMEOUT=60)
+    def test_cache_expires(self):
+        """Sitemaps of old versions shouldn't stay in the cache forever"""
+        with mock.patch('blog.sitemaps.cache.set') as cache_set:
+            b''.join(self.client.get(reverse('sitemap')).streaming_content)
+        self.assertEqual(cache_set.call_args[0][2], 60)
+
+    @override_settings(BLOG_SITEMAP_LIMIT=2)
+    def test_tag_rename(self):
+        """Renamed tag shouldn't be listed with its old slug, which gives 404 now"""
+        python = Tag.objects.create(name="Python", slug="python")
+        add_post('Good post', True, 'This is test content!', tags=[python])
+        b''.join(self.client.get(reverse('sitemap')).streaming_content)
+        b''.join(self.client.get(reverse('sitemap_section', args=['tags', 1])).streaming_content)
+
+        python.slug = 'py3'
+        python.save()
+        kind, locs = sitemap_locs(self.client.get(reverse('sitemap_section', args=['tags', 1])))
+        self.assertEqual(locs, ['http://testserver/tag/py3/'])
+
+
+class SearchTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        from . import views
+        views.POSTS_PER_PAGE = 5
+
+    def add_indexed_post(self, title, published, content):
+        post = add_post(title, published, content)
+        PostAdmin(Post, admin.site).save_model(None, post, None, False)
+        return post
+
+    def search(self, query, page=1):
+        response = self.client.get(reverse('search'), {'q': query, 'page': page})
+        self.assertEqual(response.status_code, 200)
+        return [post.title for post in response.context['posts']]
+
+    def test_ranking(self):
+        self.add_indexed_post('Something else', True, 'Django is mentioned once here.')
+        self.add_indexed_post('Django tips', True, 'Few things about Django.')
+        self.add_indexed_post('Django secrets', False, 'Unpublished Django post.')
+        self.add_indexed_post('Flask', True, 'Nothing to see here.')
+
+        self.assertEqual(self.search('django'), ['Django tips', 'Something else'])
+        self.assertEqual(self.search('DJANGO tips'), ['Django tips'])
+        self.assertEqual(self.search('django flask'), [])
+        self.assertEqual(self.search(''), [])
+
+        self.client.force_login(get_test_user_tom())
+        self.assertIn('Django secrets', self.search('django'))
+
+    @override_settings(BLOG_SEARCH_BACKEND='python')
+    def test_python_backend(self):
+        self.test_ranking()
+        self.assertEqual(self.search('zażółć'), [])
+        self.add_indexed_post('Zażółć gęślą jaźń', True, 'Polish letters.')
+        self.assertEqual(self.search('ZAŻÓŁĆ'), ['Zażółć gęślą jaźń'])
+
+    def test_pagination(self):
+        for n in range(1, 8):
+            self.add_indexed_post('Post ' + str(n), True, 'Common words.')
+
+        self.assertEqual(len(self.search('common')), 5)
+        self.assertEqual(self.search('common', 2), ['Post 2', 'Post 1'])
+        self.assertEqual(self.search('common', 99), ['Post 2', 'Post 1'])
+
+    def test_incremental(self):
+        post = self.add_indexed_post('Old title', True, 'Content.')
+        post.title = 'New title'
+        PostAdmin(Post, admin.site).save_model(None, post, None, True)
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('new'), ['New title'])
+
+        post.delete()
+        self.assertEqual(self.search('new'), [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM blog_post_fts')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_rebuild(self):
+        add_post('Not indexed', True, 'Created without admin.')
+        self.assertEqual(self.search('indexed'), [])
+
+        output = StringIO()
+        call_command('rebuild_search_index', stdout=output)
+        self.assertIn('Indexed 1 posts', output.getvalue())
+        self.assertEqual(self.search('indexed'), ['Not indexed'])
+
+
+class ProfilingTests(BlogTestCase):
+    def test_disabled(self):
+        add_post('Good post', True, 'This is test content!')
+        self.assertNotIn('Server-Timing', self.client.get(reverse('index')))
+
+    @override_settings(BLOG_PROFILING=True)
+    def test_server_timing(self):
+        add_post('Good post', True, 'This is test content!')
+        response = self.client.get(reverse('post', args=['good-post']))
+        self.assertRegex(response['Server-Timing'], r'^db;desc="Database \([1-9][0-9]* queries\)";dur=[0-9.]+, '
+                                                    r'template;.*context;.*images;.*total;desc="Total";dur=[0-9.]+$')
+        self.assertNotIn('Server-Timing', self.client.get('/admin/login/'))
+
+    @override_settings(BLOG_PROFILING=True)
+    def test_stats(self):
+        add_post('Good post', True, 'This is test content!')
+        for _ in range(3):
+            self.client.get(reverse('index'))
+        self.client.get(reverse('rss_index'))
+
+        output = StringIO()
+        call_command('profile_stats', '--histograms', '--reset', stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertRegex([line for line in lines if line.startswith('index ')][0], r'^index +3 ')
+        self.assertRegex([line for line in lines if line.startswith('rss_index ')][0], r'^rss_index +1 ')
+
+        output = StringIO()
+        call_command('profile_stats', stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+
+    def test_record_culled_key(self):
+        """Bucket evicted between add and incr is created again instead of failing the request"""
+        from .profiling import histogram_key, histograms, record
+
+        values = {'total': 1, 'db': 1, 'queries': 1, 'template': 1, 'context': 1, 'images': 1}
+        key = histogram_key('index', 'total', 0)
+        with mock.patch('django.core.cache.cache.incr', side_effect=[ValueError] + [None] * 10):
+            record('index', values)
+        self.assertEqual(cache.get(key), 1)
+
+        record('index', values)
+        self.assertEqual(histograms('index')['total'][0], 2)
+
+    @override_settings(BLOG_PROFILING=True,
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_requires_shared_cache(self):
+        """Histograms in local memory of web workers could never be read by profile_stats"""
+        from django.core.exceptions import ImproperlyConfigured
+        from django.core.management.base import CommandError
+        from .profiling import ProfilingMiddleware
+
+        with self.assertRaises(ImproperlyConfigured):
+            ProfilingMiddleware(lambda request: None)
+        with self.assertRaises(CommandError):
+            call_command('profile_stats', stdout=StringIO())
+
+
+class BenchmarkViewsTests(BlogTestCase):
+    def test_run(self):
+        """Harness is run on the test database, benchmark_views creates its own one"""
+        from .management.commands import benchmark_views
+        options = {'posts': 12, 'tags': 3, 'images': 1, 'pages': 1, 'seed': 0, 'requests': 3, 'warmup': 1,
+                   'no_page_cache': True}
+        rng = random.Random(0)
+        benchmark_views.seed(options, rng)
+        self.assertEqual(Post.objects.filter(published=True).count(), 11)
+
+        results = benchmark_views.Command().run(options, rng)
+        self.assertEqual(sorted(results['endpoints']), sorted(benchmark_views.ENDPOINTS))
+        for result in results['endpoints'].values():
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50'], result['p99'])
+        self.assertGreater(results['endpoints']['post']['queries'], 0)
+        json.dumps(results)
+
+
+class SlugFilterTests(BlogTestCase):
+    def test_bloom_filter(self):
+        words = ['slug-%d' % n for n in range(1000)]
+        bloom = slugs.BloomFilter(words)
+        for word in words:
+            self.assertIn(word, bloom)
+        false_positives = sum(1 for n in range(10000) if 'other-%d' % n in bloom)
+        self.assertLess(false_positives, 50)
+        self.assertNotIn('anything', slugs.BloomFilter([]))
+
+    def test_unknown_slugs(self):
+        add_post('Good post', True, 'This is test content!', tags=['Python'])
+        # Filters are built on first use
+        self.client.get(reverse('post', args=['good-post']))
+        self.client.get(reverse('tag', args=['python']))
+
+        with self.assertNumQueries(0):
+            for path in [reverse('post', args=['wp-login']), reverse('tag', args=['wp-login']),
+                         reverse('tag_pagination', args=['wp-login', 2]), reverse('rss_tag', args=['wp-login'])]:
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+        self.assertEqual(self.client.get(reverse('tag', args=['python'])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('rss_tag', args=['python'])).status_code, 200)
+
+    def test_new_slugs(self):
+        self.assertEqual(self.client.get(reverse('post', args=['new-post'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('tag', args=['new-tag'])).status_code, 404)
+
+        add_post('New post', True, 'This is test content!')
+        Tag.objects.create(name='New tag', slug='new-tag')
+        self.assertEqual(self.client.get(reverse('post', args=['new-post'])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('tag', args=['new-tag'])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('rss_tag', args=['new-tag'])).status_code, 200)
+
+    def test_version_bumped_after_commit(self):
+        """Other worker could build its filter again before the new post is committed and miss it"""
+        from .cache import get_version
+
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            add_post('New post', True, 'This is test content!')
+        version = get_version('slugs')
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_version('slugs'), version)
+
+    def test_false_positive(self):
+        """Slugs let through by the filter are still looked up"""
+        with mock.patch.object(slugs.BloomFilter, '__contains__', return_value=True):
+            self.assertEqual(self.client.get(reverse('post', args=['missing'])).status_code, 404)
+            self.assertEqual(self.client.get(reverse('tag', args=['missing'])).status_code, 404)
+            self.assertEqual(self.client.get(reverse('rss_tag', args=['missing'])).status_code, 404)
+
+
+class StreamingFeedTests(BlogTestCase):
+    def get_both(self, path):
+        buffered = self.client.get(path)
+        with override_settings(BLOG_FEED_STREAMING=True):
+            streamed = self.client.get(path)
+        self.assertFalse(buffered.streaming)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed['Content-Type'], buffered['Content-Type'])
+        self.assertEqual(streamed['Last-Modified'], buffered['Last-Modified'])
+        return buffered.content, b''.join(streamed.streaming_content)
+
+    def test_same_output(self):
+        test_tag = Tag.objects.create(name="Test", slug="test")
+        add_post('Good post', True, 'Zażółć <b>gęślą</b> & "jaźń"', tags=[test_tag])
+        add_post('Bad post', False, 'This is a private post', tags=[test_tag])
+        add_post('Other post', True, 'This is test content!')
+
+        for path in [reverse('rss_index'), reverse('rss_tag', args=['test'])]:
+            buffered, streamed = self.get_both(path)
+            self.assertIn('gęślą'.encode('utf-8'), streamed)
+            self.assertEqual(streamed, buffered)
+
+    @override_settings(BLOG_FEED_SUMMARY=True, BLOG_FEED_ITEMS=2)
+    def test_same_output_summary(self):
+        for n in range(1, 5):
+            add_post('Post ' + str(n), True, 'This is test content!')
+
+        buffered, streamed = self.get_both(reverse('rss_index'))
+        self.assertEqual(streamed, buffered)
+        self.assertEqual(streamed.count(b'<item>'), 2)
+
+    @override_settings(BLOG_FEED_STREAMING=True)
+    def test_unpublished_while_streaming(self):
+        test_tag = Tag.objects.create(name="Test", slug="test")
+        for n in range(1, 4):
+            add_post('Post ' + str(n), True, 'This is test content!', tags=[test_tag])
+
+        for path in [reverse('rss_index'), reverse('rss_tag', args=['test'])]:
+            with mock.patch('blog.feeds.FEED_CHUNK_SIZE', 1):
+                content = iter(self.client.get(path).streaming_content)
+                streamed = next(content)
+                while b'<item>' not in streamed:
+                    streamed += next(content)
+                Post.objects.filter(title='Post 1').update(published=False)
+                TaggedPost.objects.filter(post__title='Post 1').update(published=False)
+                streamed += b''.join(content)
+            self.assertEqual(streamed.count(b'<item>'), 2)
+            self.assertNotIn(b'Post 1', streamed)
+            Post.objects.filter(title='Post 1').update(published=True)
+            TaggedPost.objects.filter(post__title='Post 1').update(published=True)
+
+    @override_settings(BLOG_FEED_STREAMING=True)
+    def test_unknown_tag(self):
+        with mock.patch.object(slugs.BloomFilter, '__contains__', return_value=True):
+            self.assertEqual(self.client.get(reverse('rss_tag', args=['missing'])).status_code, 404)
+
+
+class RefreshMarkdownTests(BlogTestCase):
+    def test_refresh_all(self):
+        for n in range(1, 8):
+            add_post('Post ' + str(n), True, 'This !-- is **post %d**' % n)
+
+        output = StringIO()
+        call_command('refresh_markdown', batch_size=3, workers=2, stdout=output)
+
+        for post in Post.objects.all():
+            self.assertHTMLEqual(post.content, '<p>This \u2014 is <strong>%s</strong></p>' % post.title.lower())
+            self.assertEqual(post.excerpt, 'This \u2014 is %s' % post.title.lower())
+        self.assertIn('3/7 posts', output.getvalue())
+        self.assertIn('Refreshed 7 posts', output.getvalue())
+
+    def test_refresh_selected(self):
+        selected = add_post('Good post', True, '*good*')
+        other = add_post('Bad post', True, '*bad*')
+
+        call_command('refresh_markdown', selected.pk, workers=1, stdout=StringIO())
+        self.assertHTMLEqual(Post.objects.get(pk=selected.pk).content, '<p><em>good</em></p>')
+        self.assertEqual(Post.objects.get(pk=other.pk).content, '*bad*')
+
+    def test_admin_action_renders_in_process(self):
+        """Web worker shouldn't be forked during request"""
+        from .admin import refresh_markdown
+
+        add_post('Good post', True, '*good*')
+        add_post('Bad post', True, '*bad*')
+        modeladmin = mock.Mock()
+        with mock.patch('multiprocessing.Pool') as pool:
+            refresh_markdown(modeladmin, None, Post.objects.all())
+        pool.assert_not_called()
+        self.assertHTMLEqual(Post.objects.get(slug='good-post').content, '<p><em>good</em></p>')
+        self.assertIn('Refreshed 2 posts', modeladmin.message_user.call_args[0][1])
+
+
+class BackgroundImageTests(BlogTestCase):
+    def test_processed_during_upload_without_workers(self):
+        image = HeaderImage.objects.create(image=example_image)
+        image.refresh_from_db()
+
+        self.assertTrue(image.image.ready)
+        self.assertRegex(image.image.name, r'^images/posts/test\w*\.jpg$')
+        self.assertEqual((image.image.width, image.image.height), (1024, 576))
+
+    @override_settings(BLOG_IMAGE_WORKERS=2)
+    def test_placeholder_until_processed(self):
+        image = HeaderImage.objects.create(image=example_image)
+        original = image.image.name
+
+        self.assertIn('/pending/', original)
+        self.assertFalse(image.image.ready)
+        self.assertTrue(image.image.url.endswith('placeholder.svg'))
+
+        # Test transaction is never committed, so queued processing never starts
+        output = StringIO()
+        call_command('process_images', run=True, stdout=output)
+        image.refresh_from_db()
+
+        self.assertTrue(image.image.ready)
+        self.assertEqual((image.image.width, image.image.height), (1024, 576))
+        self.assertFalse(image.image.storage.exists(original))
+        self.assertIn('Processed 1 images', output.getvalue())
+        self.assertIn('Pending: 0', output.getvalue())
+        self.assertIn('processed: 1', output.getvalue())
+
+    @override_settings(BLOG_IMAGE_WORKERS=2)
+    def test_pending_images_reported(self):
+        Category.objects.create(name="Python", image=example_image)
+
+        output = StringIO()
+        call_command('process_images', stdout=output)
+        self.assertIn('Pending: 1', output.getvalue())
+        self.assertIn('Queued: 1', output.getvalue())
+
+
+class FillHeaderTests(TestCase):
+    def test_same_as_processor_chain(self):
+        from PIL import Image
+        from .management.commands.benchmark_images import CHAIN, FUSED, process
+
+        for size in [(2100, 1000), (1000, 2100), (1024, 576), (1025, 300), (800, 1000), (300, 200), (5, 900)]:
+            for mode in ['RGB', 'RGBA', 'L', 'P']:
+                img = Image.effect_noise(size, 60).convert(mode)
+                expected, actual = process(CHAIN, img), process(FUSED, img)
+                self.assertEqual((actual.mode, actual.size), (expected.mode, expected.size))
+                self.assertEqual(actual.tobytes(), expected.tobytes(), '%s %dx%d' % ((mode,) + size))
+
+
+class ImageOptimizationTests(BlogTestCase):
+    def test_optimized_jpeg_within_budget(self):
+        from PIL import Image
+        from .imagekit import optimize
+
+        img = Image.effect_noise((1024, 576), 20).convert('RGB')
+        img.info['icc_profile'] = b'profile' * 1000
+        content = optimize(img, 'JPEG', {'quality': 80}, 100 * 1024)
+
+        saved = Image.open(content)
+        self.assertLessEqual(len(content.getvalue()), 100 * 1024)
+        self.assertTrue(saved.info.get('progressive'))
+        self.assertNotIn('icc_profile', saved.info)
+
+    def test_optimize_media(self):
+        from PIL import Image
+
+        image = HeaderImage.objects.create(image=example_image)
+        path = image.image.path
+        Image.effect_noise((1024, 576), 20).convert('RGB').save(path, 'JPEG', quality=95, icc_profile=b'p' * 5000)
+        size = os.path.getsize(path)
+
+        output = StringIO()
+        call_command('optimize_media', workers=1, stdout=output)
+        self.assertLess(os.path.getsize(path), size)
+        self.assertTrue(Image.open(path).info.get('progressive'))
+        self.assertIn('Optimized 1 of 1 images, saved %d bytes' % (size - os.path.getsize(path)), output.getvalue())
+
+
+class ResponsiveImageTests(BlogTestCase):
+    def test_header_variants(self):
+        image = HeaderImage.objects.create(image=example_image)
+
+        self.assertEqual((image.image_256.width, image.image_256.height), (256, 144))
+        self.assertEqual(image.image_768_webp.name.rsplit('.', 1)[1], 'webp')
+        self.assertEqual(image.srcset().count('w, '), 3)
+        self.assertIn(image.image.url + ' 1024w', image.srcset())
+        self.assertIn(image.image_1024_webp.url + ' 1024w', image.webp_srcset())
+
+    def test_listing_srcset(self):
+        post = add_post('Good post', True, 'Content')
+        post.category = Category.objects.create(name="Python", image=example_image)
+        post.save()
+
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'type="image/webp" srcset="%s' % post.image.webp_srcset())
+        self.assertContains(response, 'srcset="%s"' % post.category.srcset())
+        self.assertContains(self.client.get(reverse('post', args=[post.slug])), post.category.webp_srcset())
+
+    @override_settings(BLOG_IMAGE_WORKERS=2)
+    def test_no_srcset_for_pending_image(self):
+        image = HeaderImage.objects.create(image=example_image)
+        self.assertEqual(image.srcset(), '')
+
+
+class FragmentTests(BlogTestCase):
+    def test_fragments_render_like_templates(self):
+        """Listings should look the same with and without pre-rendered fragments"""
+        category = Category.objects.create(name="Python", image=example_image)
+        for n in range(1, 4):
+            post = add_post('Post %d' % n, True, 'Content', tags=['python', 'django'])
+            post.category = category
+            post.save()
+
+        def render(path):
+            return ' '.join(self.client.get(path).content.decode().split())
+
+        index = render(reverse('index'))
+        tag = render(reverse('tag', args=['python']))
+        call_command('rebuild_fragments', stdout=StringIO())
+
+        self.assertIn('Post 1', Post.objects.get(slug='post-1').preview_html)
+        self.assertIn('django', Post.objects.get(slug='post-1').widget_html)
+        self.assertEqual(render(reverse('index')), index)
+        self.assertEqual(render(reverse('tag', args=['python'])), tag)
+
+    def test_listings_use_fragments(self):
+        post = add_post('Good post', True, 'Content', tags=['python'])
+        Post.objects.filter(pk=post.pk).update(preview_html='<p>Stored preview</p>', widget_html='<p>Stored widget</p>')
+
+        self.assertContains(self.client.get(reverse('index')), 'Stored preview')
+        self.assertContains(self.client.get(reverse('tag', args=['python'])), 'Stored widget')
+
+    def test_publish_refreshes_fragments(self):
+        from .admin import publish
+
+        post = add_post('Good post', False, 'Content')
+        call_command('rebuild_fragments', post.pk, stdout=StringIO())
+        self.assertIn('Niepublikowane', Post.objects.get(pk=post.pk).preview_html)
+
+        publish(None, None, Post.objects.filter(pk=post.pk))
+        self.assertNotIn('Niepublikowane', Post.objects.get(pk=post.pk).preview_html)
+
+    def test_plain_save_refreshes_fragments(self):
+        """Posts saved outside of admin, e.g. from shell, should be shown as they are"""
+        post = add_post('Good post', False, 'Content')
+        self.assertIn('Niepublikowane', Post.objects.get(pk=post.pk).preview_html)
+
+        post.published = True
+        post.title = 'Better post'
+        post.slug = 'better-post'
+        post.save()
+        preview = Post.objects.get(pk=post.pk).preview_html
+        self.assertNotIn('Niepublikowane', preview)
+        self.assertIn('Better post', preview)
+        self.assertIn(reverse('post', args=['better-post']), preview)
+
+    def test_unrelated_save_keeps_fragments(self):
+        post = add_post('Good post', True, 'Content')
+        Post.objects.filter(pk=post.pk).update(preview_html='<p>Stored preview</p>')
+
+        post.preview_html = '<p>Stored preview</p>'
+        post.raw_content = 'Other content'
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).preview_html, '<p>Stored preview</p>')
+
+    def test_category_change_refreshes_fragments(self):
+        category = Category.objects.create(name="Python", image=example_image)
+        post = add_post('Good post', True, 'Content')
+        post.category = category
+        post.save()
+
+        category.image = SimpleUploadedFile(name='other.png', content=open('test.png', 'rb').read())
+        category.save()
+        self.assertIn(Category.objects.get(pk=category.pk).image.url, Post.objects.get(pk=post.pk).preview_html)
+
+
+    def test_tag_rename_refreshes_fragments(self):
+        python = Tag.objects.create(name="Python", slug="python")
+        add_post('Good post', True, 'Content', tags=[python, 'django'])
+
+        python.name = 'Py3'
+        python.slug = 'py3'
+        python.save()
+
+        response = self.client.get(reverse('tag', args=['django']))
+        self.assertContains(response, reverse('tag', args=['py3']))
+        self.assertNotContains(response, reverse('tag', args=['python']))
+
+    def test_tagging_refreshes_fragments(self):
+        """Tags changed outside of admin should be shown on tag listings too"""
+        post = add_post('Good post', True, 'Content', tags=['python'])
+
+        post.tags.add('django')
+        self.assertIn(reverse('tag', args=['django']), Post.objects.get(pk=post.pk).widget_html)
+        post.tags.remove('django')
+        self.assertNotIn(reverse('tag', args=['django']), Post.objects.get(pk=post.pk).widget_html)
+
+class ExportStaticTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        from . import views
+        views.POSTS_PER_PAGE = 2
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+
+    def tearDown(self):
+        from . import views
+        views.POSTS_PER_PAGE = 5
+
+    def export(self, **options):
+        output = StringIO()
+        call_command('export_static', self.output, processes=1, stdout=output, **options)
+        return output.getvalue()
+
+    def read(self, path):
+        with open(os.path.join(self.output, path), encoding='utf-8') as f:
+            return f.read()
+
+    def test_full_export(self):
+        for n in range(1, 4):
+            add_post('Post %d' % n, True, 'Content %d' % n, tags=['python'])
+        add_post('Secret post', False, 'Secret', tags=['python'])
+        Page.objects.create(title='About', slug='about', content='About me')
+
+        self.export()
+
+        self.assertIn('Post 3', self.read('index.html'))
+        self.assertIn('Post 1', self.read('2/index.html'))
+        self.assertIn('Content 2', self.read('post/post-2/index.html'))
+        self.assertIn('About me', self.read('page/about/index.html'))
+        self.assertIn('Post 3', self.read('tag/python/index.html'))
+        self.assertIn('Post 1', self.read('tag/python/2/index.html'))
+        self.assertIn('<rss', self.read('rss/index.xml'))
+        self.assertIn('<rss', self.read('tag/python/rss/index.xml'))
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'post/secret-post')))
+
+    def test_incremental_export(self):
+        for n in range(1, 6):
+            add_post('Post %d' % n, True, 'Content %d' % n, tags=['python' if n < 3 else 'django'])
+        self.export()
+        self.assertIn('Rendered 0 pages', self.export(incremental=True))
+
+        # Post 1 is on the last page, so only it, its tag and feeds are rendered again
+        post = Post.objects.get(slug='post-1')
+        post.content = 'Changed content'
+        post.save()
+        self.assertIn('Rendered 6 pages', self.export(incremental=True))
+        self.assertIn('Changed content', self.read('post/post-1/index.html'))
+
+        Post.objects.get(slug='post-5').delete()
+        self.assertIn('removed 3', self.export(incremental=True))
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'post/post-5')))
+        self.assertFalse(os.path.exists(os.path.join(self.output, '3')))
+        self.assertNotIn('Post 5', self.read('index.html'))
+
+
 class MarkdownEditorTests(TestCase):
     def __init__(self, methodName):
         super().__init__(methodName)
@@ -389,3 +1544,39 @@ class MarkdownEditorTests(TestCase):
                           '</p>')
 
         self.assertHTMLEqual(output, correct_output)
+
+    def test_pipeline_built_once(self):
+        self.assertIs(get_markdown(), get_markdown())
+
+    def test_render_cache(self):
+        """Unchanged content should not be parsed again"""
+        test_string = "Gallery[http://via.placeholder.com/350x150]\n\nThis !-- is endash"
+        output = render_markdown(test_string)
+        self.assertHTMLEqual(output, self.markdown.render(test_string))
+
+        with mock.patch('blog.markdown.get_markdown') as get_markdown_mock:
+            self.assertEqual(render_markdown(test_string), output)
+            get_markdown_mock.assert_not_called()
+
+    def test_custom_tags_with_nested_brackets(self):
+        output = self.markdown.render("![Figure [1]][alt](http://pl.wikipedia.org/wiki/Python_(język))")
+        self.assertHTMLEqual(output, '<p><figure><img src="http://pl.wikipedia.org/wiki/Python_(język)" alt="alt" />'
+                                     '<div>Figure [1]</div></figure></p>')
+
+    def test_pathological_custom_tags(self):
+        """
+        Custom tags should be matched on long adversarial lines without backtracking
+
+        re has no step counter, so the bound is time: linear matching of 10^5 characters takes
+        milliseconds, greedy patterns never finished. Growth is measured by benchmark_markdown.
+        """
+        import time
+        from .management.commands.benchmark_markdown import ADVERSARIAL_INPUTS
+
+        rules = get_markdown().inline.rules
+        for name, make_input in sorted(ADVERSARIAL_INPUTS.items()):
+            text = make_input(10 ** 5 // len(make_input(1)))
+            start = time.perf_counter()
+            for rule in [rules.woo, rules.figure, rules.gallery]:
+                rule.match(text)
+            self.assertLess(time.perf_counter() - start, 5, name)
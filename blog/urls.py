@@ -2,7 +2,7 @@ from django.conf.urls import url
 from django.conf import settings
 from django.conf.urls.static import static
 
-from . import views, feeds
+from . import views, feeds, sitemaps
 
 urlpatterns = [
     url(r'^$', views.index, name='index'),
@@ -14,5 +14,8 @@ urlpatterns = [
     url(r'^tag/(?P<tag_slug>[aA-zZ0-9-]+)/$', views.tag, name='tag'),
     url(r'^rss/$', feeds.LatestPostsFeed(), name='rss_index'),
     url(r'^tag/(?P<tag_slug>[aA-zZ0-9-]+)/rss/$', feeds.TagPostsFeed(), name='rss_tag'),
+    url(r'^search/$', views.search, name='search'),
+    url(r'^sitemap\.xml$', sitemaps.index, name='sitemap'),
+    url(r'^sitemap-(?P<name>posts|pages|tags)-(?P<page>[0-9]+)\.xml$', sitemaps.section, name='sitemap_section'),
     url(r'^youtube$', views.youtube, name='youtube')
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+
+def write_atomic(filename, content):
+    """Writes file so that nginx never serves it half-written"""
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, filename)
+
+
+def percentile(values, percent):
+    """Returns value below which given percent of values fall, by nearest rank"""
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(percent / 100.0 * len(values))) - 1))]
@@ -1,33 +1,79 @@
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import prefetch_related_objects
 from taggit.models import Tag
 
-from .models import Post, Page
+from .cache import cache_page_anonymous, conditional
+from .context_processors import cached_pages
+from .models import Post, TaggedPost
+from .pagination import KeysetPaginator
+from .search import search_posts
+from .slugs import known_slug
 
 
 POSTS_PER_PAGE = 5
 
+# Use (pub_date, id) keys instead of COUNT and OFFSET queries for listings
+KEYSET_PAGINATION = True
+
+
+def paginate(posts, page, name, key=('pub_date', 'pk')):
+    """Returns n-th page of posts ordered by key, n out of range gives the last page"""
+    if KEYSET_PAGINATION:
+        return KeysetPaginator(posts, POSTS_PER_PAGE, name, key).page(page)
+
+    paginator = Paginator(posts.order_by('-' + key[0], '-' + key[1]), POSTS_PER_PAGE)
+    try:
+        return paginator.page(page)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def visible_posts(request):
+    """Returns posts which can be seen by the user"""
+    if not request.user.is_authenticated:
+        return Post.objects.filter(published=True)
+    return Post.objects.all()
+
+
+def tagged_posts(request, tag_slug):
+    """Returns index entries of posts with given tag which can be seen by the user"""
+    entries = TaggedPost.objects.filter(tag__slug=tag_slug)
+    if not request.user.is_authenticated:
+        entries = entries.filter(published=True)
+    return entries
+
+
+def listing(posts):
+    """Joins objects shown in previews and skips large columns which are not shown"""
+    return posts.select_related('image', 'category').defer('raw_content', 'content', 'excerpt', 'widget_html')
+
+
+def tag_listing(entries):
+    """Same as listing, but for entries of tag index"""
+    return entries.select_related('post', 'post__image', 'post__category').defer(
+        'post__raw_content', 'post__content', 'post__excerpt', 'post__preview_html')
+
 
 def index(request):
     """Displays first page with latest posts"""
     return index_pagination(request, 1)
 
 
+@conditional(lambda request, pagination: visible_posts(request))
+@cache_page_anonymous
 def index_pagination(request, pagination):
     """Displays n-th page with latest posts"""
     page = int(pagination)
     if not request.user.is_authenticated:
         posts_published = Post.objects.filter(published=True).order_by('-pub_date')
+        posts = paginate(listing(posts_published), page, 'index:published')
     else:
         posts_published = Post.objects.order_by('-pub_date')
-    paginator = Paginator(posts_published, POSTS_PER_PAGE)
-
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+        posts = paginate(listing(posts_published), page, 'index:all')
 
     context = {
         'posts': posts
@@ -35,6 +81,9 @@ def index_pagination(request, pagination):
     return render(request, 'blog/index.html', context)
 
 
+@known_slug('post', 'post_slug')
+@conditional(lambda request, post_slug: visible_posts(request).filter(slug=post_slug))
+@cache_page_anonymous
 def post(request, post_slug):
     """Displays single post"""
     if not request.user.is_authenticated:
@@ -51,23 +100,23 @@ def tag(request, tag_slug):
     return tag_pagination(request, tag_slug, 1)
 
 
+@known_slug('tag', 'tag_slug')
+@conditional(lambda request, tag_slug, pagination: tagged_posts(request, tag_slug))
+@cache_page_anonymous
 def tag_pagination(request, tag_slug, pagination):
     """Displays n-th page with posts with given tag"""
     page = int(pagination)
+    tag = get_object_or_404(Tag, slug=tag_slug)
     if not request.user.is_authenticated:
-        posts_with_tag = Post.objects.filter(published=True).filter(tags__slug__in=[tag_slug]).order_by('-pub_date').all()
+        entries = TaggedPost.objects.filter(tag=tag, published=True)
+        posts = paginate(tag_listing(entries), page, 'tag:%s:published' % tag_slug, key=('pub_date', 'post_id'))
     else:
-        posts_with_tag = Post.objects.filter(tags__slug__in=[tag_slug]).order_by('-pub_date').all()
-    paginator = Paginator(posts_with_tag, POSTS_PER_PAGE)
-
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+        entries = TaggedPost.objects.filter(tag=tag)
+        posts = paginate(tag_listing(entries), page, 'tag:%s:all' % tag_slug, key=('pub_date', 'post_id'))
+    posts.object_list = [entry.post for entry in posts.object_list]
+    # Tags are shown by widget fragments, only posts without saved fragment render them from template
+    prefetch_related_objects([post for post in posts.object_list if not post.widget_html], 'tags')
 
-    tag = Tag.objects.get(slug=tag_slug)
     context = {
         'posts': posts,
         'tag': tag
@@ -75,12 +124,34 @@ def tag_pagination(request, tag_slug, pagination):
     return render(request, 'blog/tag.html', context)
 
 
+@cache_page_anonymous
 def page(request, page_slug):
     """Displays page"""
-    page = Page.objects.get(slug=page_slug)
+    # All pages are cached for navigation anyway, so unknown slugs are 404 without any query
+    page = next((page for page in cached_pages() if page.slug == page_slug), None)
+    if page is None:
+        raise Http404('No page with slug %s' % page_slug)
     context = {'page': page}
     return render(request, 'blog/page.html', context)
 
 
+def search(request):
+    """Displays posts containing all words from q parameter, the best matches first"""
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(search_posts(listing(visible_posts(request)), query), POSTS_PER_PAGE)
+    try:
+        posts = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        posts = paginator.page(1)
+    except EmptyPage:
+        posts = paginator.page(paginator.num_pages)
+
+    context = {
+        'posts': posts,
+        'query': query
+    }
+    return render(request, 'blog/search.html', context)
+
+
 def youtube(request):
     return redirect('https://www.youtube.com/channel/UCHPUGfK2zW0VUNN2SgCHsXg')
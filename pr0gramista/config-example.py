@@ -30,5 +30,14 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Cache is required and must be shared by all processes of the site, local memory cache won't do.
+# By default files in BASE_DIR/cache are used, with many workers memcached is a better choice
+#CACHES = {
+#    'default': {
+#        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#        'LOCATION': '127.0.0.1:11211',
+#    }
+#}
+
 # Put your Google Analytics tag here
 ANALYTICS = 'UA-XXXXX'
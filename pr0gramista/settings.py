@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Does nothing unless BLOG_PROFILING is on
+    'blog.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +89,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+# Must be shared by all processes of the site (web workers, management commands), otherwise
+# cached pages aren't purged, conditional GET validators and filters of slugs differ between them
+CACHES = getattr(config, 'CACHES', {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+})
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -132,3 +148,43 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = config.MEDIA_ROOT
 
 ANALYTICS = config.ANALYTICS
+
+
+# Blog tuning
+
+# Seconds to keep site chrome (pages, social links, tags) used by context processors
+BLOG_CHROME_CACHE_TIMEOUT = getattr(config, 'BLOG_CHROME_CACHE_TIMEOUT', 300)
+
+# Seconds to keep whole pages rendered for anonymous readers, 0 disables the cache
+BLOG_PAGE_CACHE_TIMEOUT = getattr(config, 'BLOG_PAGE_CACHE_TIMEOUT', 600)
+
+# Maximum number of posts in RSS feeds, None for all of them
+BLOG_FEED_ITEMS = getattr(config, 'BLOG_FEED_ITEMS', 20)
+
+# Put only plain text excerpts instead of whole posts in RSS feeds
+BLOG_FEED_SUMMARY = getattr(config, 'BLOG_FEED_SUMMARY', False)
+
+# Stream RSS feeds item by item instead of building whole XML in memory, output is the same
+BLOG_FEED_STREAMING = getattr(config, 'BLOG_FEED_STREAMING', False)
+
+# Number of threads processing uploaded images in background, 0 processes them during upload
+BLOG_IMAGE_WORKERS = getattr(config, 'BLOG_IMAGE_WORKERS', 2)
+
+# Static file shown instead of images which are still processed
+BLOG_IMAGE_PLACEHOLDER = getattr(config, 'BLOG_IMAGE_PLACEHOLDER', 'placeholder.svg')
+
+# Maximum number of URLs in sitemap.xml, above it sitemap is split into files listed in sitemap index
+BLOG_SITEMAP_LIMIT = getattr(config, 'BLOG_SITEMAP_LIMIT', 50000)
+
+# Seconds to keep sitemap files, they are built again sooner when posts, pages or slugs change
+BLOG_SITEMAP_CACHE_TIMEOUT = getattr(config, 'BLOG_SITEMAP_CACHE_TIMEOUT', 86400)
+
+# Index used by search: 'fts5' (SQLite), 'mysql' or 'python', by default the best one for the database
+# After changing it run rebuild_search_index
+BLOG_SEARCH_BACKEND = getattr(config, 'BLOG_SEARCH_BACKEND', None)
+
+# Measure queries, templates and context processors of blog views, see profile_stats command (needs shared CACHES)
+BLOG_PROFILING = getattr(config, 'BLOG_PROFILING', False)
+
+# Seconds after which filters of existing slugs are built again even if no slug changed
+BLOG_SLUG_FILTER_TIMEOUT = getattr(config, 'BLOG_SLUG_FILTER_TIMEOUT', 300)